@@ -1,4 +1,4 @@
-from os import environ
+from os import environ, getenv
 environ["OPENCV_LOG_LEVEL"] = "SILENT"
 from cv2 import (
     VideoCapture,
@@ -29,14 +29,20 @@ from PIL import Image
 from tools.cameras import get_cameras
 import image_processing.linedraw as linedraw
 import rtde.command as command
-import image_processing.trajectory_maker as ct
-from image_processing import image_scanner
+from image_processing.A4_calibration import PEN_HEIGHT_MM
+from image_processing.cache import ResultCache
+from image_processing.pipeline import TrajectoryPipeline, warp
 import tools.pingger as pingger
 from dotenv import load_dotenv
 from numpy import ndarray
 
 load_dotenv("config/.env")
 
+# Longest side of the image processed while the slider is moving
+QUICK_PREVIEW_SIZE = 480
+# Gap between two strokes drawn without lifting the pen, in mm
+LIFT_TOLERANCE_MM = 0.5
+
 
 class VideoApp(CTk):
     def __init__(self):
@@ -172,7 +178,19 @@ class VideoApp(CTk):
 
         # Needed for the slider's callback
         self.timer = None
+        self.quick_timer = None
         self.lock = Lock()
+        # Incremented at every change of setting, older results are not shown
+        self.generation = 0
+        self.full_generation = -1
+
+        # Results already computed, kept on disk too if CACHE_DIR is set
+        self.cache = ResultCache(directory=getenv("CACHE_DIR") or None)
+        # Stages of the last computation, one pipeline for the quick previews
+        self.pipelines = {False: TrajectoryPipeline(), True: TrajectoryPipeline()}
+        # Photo straightened by the full preview, given to both pipelines
+        self.warped = None
+        self.warp_lock = Lock()
 
     def take_photo(self):
         if self.frame is not None:
@@ -252,61 +270,151 @@ class VideoApp(CTk):
         self.after(32, self.update_frame)  # Update every 32ms
 
     def update_slider(self, value):
-        """callback of the slider, update the priview if the slider is untouched during 0.4 second"""
+        """callback of the slider, show an approximate preview at once and update the
+        full one if the slider is untouched during 0.4 second"""
 
         self.value_slider_label.configure(text=f"Actual value : {int(value)/10}")
 
         with self.lock:
-            # cancel the old timer if one is running
-            if self.timer is not None:
-                self.timer.cancel()
+            self.generation += 1
+
+            self.cancel_timers()
 
-            # start the timer
+            # start the timers
+            self.quick_timer = Timer(0.05, self.update_preview_image, [None, True])
+            self.quick_timer.start()
             self.timer = Timer(0.4, self.update_preview_image)
             self.timer.start()
 
-    def update_preview_image(self, _=None):
-        """update the frame of the preview"""
+    def cancel_timers(self):
+        """cancel the pending previews of the slider, call it with the lock held"""
+
+        if self.timer is not None:
+            self.timer.cancel()
+        if self.quick_timer is not None:
+            self.quick_timer.cancel()
+
+    def update_preview_image(self, _=None, quick=False):
+        """update the frame of the preview, on a downscaled image if quick is True"""
 
         # check if a preview already exist
         if self.frame_4_preview is None:
             return
+        if quick and self.dropdown_type.get() == "linedraw":
+            # linedraw doesn't use the slider and already runs on a small image
+            return
 
-        image_resized = None
-        if self.varCheckResize.get():
-            # image_resized = resizer.binaryResizeA4(self.frame_4_preview)
-            # image_resized = ImageScanner(self.frame_4_preview,"").scan()
-            document_contour = image_scanner.scan_detection(self.frame_4_preview)
-            image_resized = image_scanner.four_point_transform(
-                self.frame_4_preview, document_contour.reshape(4, 2)
-            )
+        with self.lock:
+            if not quick:
+                self.generation += 1
+            generation = self.generation
+
+        result, reused = self.get_result(quick)
+        if result is None:
+            return
+        points, nb_points, nb_contours, treated_image = result
+
+        with self.lock:
+            # A newer setting was asked meanwhile, or the full result is already shown
+            if generation != self.generation or (
+                quick and self.full_generation == generation
+            ):
+                return
+            if not quick:
+                self.full_generation = generation
+            self.treated_image = treated_image
+
+        approximate = " (approximate)" if quick else ""
+        self.points_label.configure(
+            text=f"There are {nb_points} points and {nb_contours} contours{approximate}"
+            f"\nReused stages: {reused}"
+        )
+        self.show_preview_image(self.treated_image)
 
-        image_4_treatement = (
-            image_resized if image_resized is not None else self.frame_4_preview
+    def get_result(self, quick=False) -> tuple:
+        """return the result of the photo with the current settings and the stages
+        reused to compute it, from the cache if this photo was already processed
+        with these settings, None if quick and the sheet isn't straightened yet"""
+
+        method = self.dropdown_type.get()
+        params = dict(
+            method=method,
+            crop=self.varCheckResize.get(),
+            size=self.get_label("treated")[0],
+            lift_tolerance_mm=LIFT_TOLERANCE_MM,
+        )
+        if method != "linedraw":
+            params["epsilon"] = self.slider.get() / 10
+            params["quick"] = quick
+        # The results on disk outlive the process, a new pen height must not reuse them
+        key = ResultCache.key(
+            self.frame_4_preview, pen_height_mm=PEN_HEIGHT_MM, **params
         )
+        result = self.cache.get(key)
+        reused = "all (cached result)"
+        if result is None:
+            stats = {}
+            result = self.compute_trajectory(**params, stats=stats)
+            if result is None:
+                return None, None
+            # The quick results only last while the slider moves, not worth a write
+            self.cache.put(key, result, persist=not quick)
+            reused = ", ".join(stats.get("reused", [])) or "none"
+        return result, reused
+
+    def compute_trajectory(
+        self,
+        method,
+        crop,
+        size,
+        lift_tolerance_mm=LIFT_TOLERANCE_MM,
+        epsilon=None,
+        quick=False,
+        stats=None,
+    ):
+        """compute the trajectory and the preview of the photo, on a downscaled image
+        if quick is True, reusing the stages whose settings didn't change"""
+
+        image_4_treatement = self.get_warped(crop, quick)
+        if image_4_treatement is None:
+            return None
 
         # check if the method is 'linedraw' because it's not using the same librairy
-        if self.dropdown_type.get() == "linedraw":
-            size, _ = self.get_label("treated")
+        if method == "linedraw":
             photo = Image.fromarray(image_4_treatement).resize(size)
-            self.points, nb_points, self.treated_image = linedraw.output(
-                photo, preview=True
-            )
-            nb_contours = 0
-
-        else:
-            self.points, nb_points, nb_contours, self.treated_image = (
-                ct.trajectory_computation(
-                    image_4_treatement,
-                    epsilon=self.slider.get() / 10,
-                    method=self.dropdown_type.get(),
-                )
+            points, nb_points, treated_image = linedraw.output(
+                photo, preview=True, lift_tolerance_mm=lift_tolerance_mm
             )
-
-        self.points_label.configure(
-            text=f"There are {nb_points} points and {nb_contours} contours"
+            return points, nb_points, 0, treated_image
+
+        return self.pipelines[quick].run(
+            image_4_treatement,
+            epsilon=epsilon,
+            method=method,
+            order="nearest",
+            preview_size=size,
+            max_size=QUICK_PREVIEW_SIZE if quick else None,
+            lift_tolerance_mm=lift_tolerance_mm,
+            stats=stats,
         )
-        self.show_preview_image(self.treated_image)
+
+    def get_warped(self, crop, quick=False):
+        """return the photo, with the sheet of paper straightened if crop is True,
+        None if quick and the full preview didn't straighten it yet: the corners are
+        only asked to the user once, never from the quick preview"""
+
+        if not crop:
+            return self.frame_4_preview
+        key = ResultCache.key(self.frame_4_preview)
+        warped = self.warped
+        if warped is None or warped[0] != key:
+            if quick:
+                return None
+            with self.warp_lock:
+                if self.warped is None or self.warped[0] != key:
+                    self.warped = (key, warp(self.frame_4_preview, crop)[0])
+                warped = self.warped
+        return warped[1]
 
     def show_preview_image(self, image: ndarray):
         """show the treated image in the preview box"""
@@ -382,7 +490,12 @@ class VideoApp(CTk):
             )
             self.button3.configure(state="normal")
             return
-        ret = command.startDrawing(self.points)
+        # Draw the full result of the current settings, computed here and not read
+        # from the preview so a slider timer firing meanwhile can't change it
+        with self.lock:
+            self.cancel_timers()
+        points = self.get_result()[0][0]
+        ret = command.startDrawing(points)
         if "error" in ret:
             messagebox.showwarning(
                 "Connection forbiden",
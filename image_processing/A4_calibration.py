@@ -1,5 +1,105 @@
-from numpy import array as nparray, min as npmin, max as npmax
+from numpy import (
+    arange,
+    array as nparray,
+    cumsum,
+    eye,
+    full,
+    hypot,
+    int64,
+    nonzero,
+    ones,
+    where,
+    zeros,
+)
 import os
+from dotenv import load_dotenv
+
+try:
+    from image_processing.strokes import Strokes
+except:
+    from strokes import Strokes
+
+
+# The robot starts and ends the drawings at these positions
+START_POSITION = (0.344, -0.144, 0.07, 0, 0, 0)
+END_POSITION = (0.3, 0, 0.07, 0, 0, 0)
+# Position of the corner of the drawing area, in m
+PAPER_OFFSET = (0.240, -0.170)
+
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), "config", ".env"))
+# Height of the pen in its holder, in mm, set once for the whole process
+PEN_HEIGHT_MM = float(os.getenv("PEN_HEIGHT_MM"))
+
+
+def fit_to_a4_array(
+    points,
+    desired_width=189,
+    desired_height=267.3,
+    z=58.5 / 1000,
+    pen_height_mm=None,
+):
+    """
+    Fit strokes to desired dimensions (90% of A4 by default) and build the robot waypoints.
+
+    The waypoints are the start position, then for every stroke a pen-up row above its
+    first point, its points on the paper and a pen-up row above its last point, and
+    finally the end position.
+
+    Parameters:
+    - points: List of lists containing (x, y) tuples, or Strokes.
+    - desired_width: The desired width to fit the points within.
+    - desired_height: The desired height to fit the points within.
+    - pen_height_mm: The pen height, PEN_HEIGHT_MM by default.
+
+    Returns:
+    - An (N, 6) float64 array of waypoints.
+    - The stroke of every waypoint as an (N,) array, -1 for the start and end positions.
+    """
+    strokes = Strokes.from_lists(points)
+    if pen_height_mm is None:
+        pen_height_mm = PEN_HEIGHT_MM
+    low_z = (pen_height_mm + 12.5) / 1000
+    high_z = low_z + (15 / 1000)
+
+    n, m = strokes.num_points, len(strokes)
+    waypoints = zeros((n + 2 * m + 2, 6))
+    stroke_index = full(len(waypoints), -1, int64)
+    waypoints[0] = START_POSITION
+    waypoints[-1] = END_POSITION
+    if n == 0:
+        return waypoints, stroke_index
+
+    points_array = strokes.points.astype(float)
+    low = points_array.min(axis=0)
+    extent = points_array.max(axis=0) - low
+
+    # Swap X and Y if the drawing is portrait
+    swap = extent[0] / extent[1] < desired_width / desired_height
+    axes = eye(2)[::-1] if swap else eye(2)
+    low, extent = axes @ low, axes @ extent
+
+    # One affine transform: scale, center on the paper, put in m and add the offset
+    scale = min(desired_width / extent[0], desired_height / extent[1])
+    centering = (nparray([desired_width, desired_height]) - extent * scale) / 2
+    linear = axes * scale / 1000
+    shift = (centering - low * scale) / 1000 + PAPER_OFFSET
+
+    # Each stroke adds a pen-up row before its points and one after them
+    strokes_of_points = strokes.stroke_index()
+    rows = 2 + arange(n) + 2 * strokes_of_points
+    waypoints[rows, :2] = points_array @ linear.T + shift
+    waypoints[rows, 2] = low_z
+    stroke_index[rows] = strokes_of_points
+
+    first = rows[strokes.offsets[:-1]]
+    last = rows[strokes.offsets[1:] - 1]
+    waypoints[first - 1, :2] = waypoints[first, :2]
+    waypoints[last + 1, :2] = waypoints[last, :2]
+    waypoints[first - 1, 2] = high_z
+    waypoints[last + 1, 2] = high_z
+    stroke_index[first - 1] = arange(m)
+    stroke_index[last + 1] = arange(m)
+    return waypoints, stroke_index
 
 
 def fit_to_a4(points, desired_width=189, desired_height=267.3, z=58.5 / 1000):
@@ -7,109 +107,51 @@ def fit_to_a4(points, desired_width=189, desired_height=267.3, z=58.5 / 1000):
     Fit a list of points to desired dimensions (90% of A4 by default).
 
     Parameters:
-    - points: List of lists containing (x, y) tuples.
+    - points: List of lists containing (x, y) tuples, or Strokes.
     - desired_width: The desired width to fit the points within.
     - desired_height: The desired height to fit the points within.
 
     Returns:
-    - List of lists with transformed (x, y) tuples.
+    - List of [x, y, z, 0, 0, 0] waypoints, see fit_to_a4_array.
     """
-    # Flatten the list of points and convert to numpy array for easier manipulation
-    points_array = nparray([point for sublist in points for point in sublist])
-
-    # Find the bounding box
-    min_x, min_y = npmin(points_array, axis=0)
-    max_x, max_y = npmax(points_array, axis=0)
-
-    # Calculate the current width and height
-    current_width = max_x - min_x
-    current_height = max_y - min_y
-
-    # Calculate aspect ratios
-    current_aspect_ratio = current_width / current_height
-    desired_aspect_ratio = desired_width / desired_height
-
-    # Check if the orientation is portrait
-    if current_aspect_ratio < desired_aspect_ratio:
-        # Swap X and Y coordinates
-        points_array[:, [0, 1]] = points_array[:, [1, 0]]
-        current_width, current_height = current_height, current_width
-
-    # Calculate scale factors
-    scale_x = desired_width / current_width
-    scale_y = desired_height / current_height
-    scale = min(scale_x, scale_y)
-
-    # Scale the points
-    scaled_points = points_array * scale
-
-    # Translate the points to center them
-    translated_points = (
-        scaled_points
-        - npmin(scaled_points, axis=0)
-        + nparray(
-            [
-                (
-                    desired_width
-                    - npmax(scaled_points[:, 0] - npmin(scaled_points[:, 0]))
-                )
-                / 2,
-                (
-                    desired_height
-                    - npmax(scaled_points[:, 1] - npmin(scaled_points[:, 1]))
-                )
-                / 2,
-            ]
-        )
-    )
-    # Put in m and adds the offset
-    translated_points = (translated_points / 1000) + (0.240, -0.170)
+    return fit_to_a4_array(points, desired_width, desired_height, z)[0].tolist()
 
-    low_z = 55 / 1000
-    high_z = 70 / 1000
-    
-    low_z = (float(os.getenv("PEN_HEIGHT_MM")) + 12.5) /1000
-    high_z = low_z + (15 / 1000)
 
-    # Reshape back to the original structure
-    reshaped_points = [
-        [0.344, -0.144, 0.07, 0, 0, 0]
-    ]  # The robot always starts at this point
-    index = 0
-    for i in range(len(points)):
-        # Goes to the first point without touching the paper
-        coordinates = [
-            float(translated_points[index][0]),
-            float(translated_points[index][1]),
-            high_z,
-            0,
-            0,
-            0,
-        ]
-        reshaped_points.append(coordinates)
-        # Goes through all the points with touching the paper
-        for j in range(len(points[i])):
-            coordinates = [
-                float(translated_points[index + j][0]),
-                float(translated_points[index + j][1]),
-                low_z,
-                0,
-                0,
-                0,
-            ]
-            reshaped_points.append(coordinates)
-
-        # Lifts the pen
-        index += len(points[i]) - 1
-        coordinates = [
-            float(translated_points[index][0]),
-            float(translated_points[index][1]),
-            high_z,
-            0,
-            0,
-            0,
-        ]
-        reshaped_points.append(coordinates)
-        index += 1
-    reshaped_points.append([0.3, 0, 0.07, 0, 0, 0])
-    return reshaped_points
+def merge_pen_lifts(waypoints, stroke_index, tolerance_mm=0.5):
+    """
+    Join the consecutive strokes whose gap is below a tolerance into one pen-down path.
+
+    The pen-up row after the first stroke and the one before the next stroke are
+    removed, so the robot goes straight from one to the other on the paper.
+
+    Parameters:
+    - waypoints: The (N, 6) waypoints given by fit_to_a4_array.
+    - stroke_index: The stroke of every waypoint given by fit_to_a4_array.
+    - tolerance_mm: The largest gap, in mm, drawn instead of lifting the pen.
+
+    Returns:
+    - The remaining waypoints.
+    - Their stroke, the joined strokes sharing the index of the first one.
+    - The number of pen lifts removed.
+    """
+    # Row i lifts the pen after a stroke and row i + 1 lowers it for the next one
+    lifts = nonzero(
+        (stroke_index[:-1] >= 0)
+        & (stroke_index[1:] >= 0)
+        & (stroke_index[:-1] != stroke_index[1:])
+    )[0]
+    gaps = waypoints[lifts + 2, :2] - waypoints[lifts - 1, :2]
+    merged = lifts[hypot(gaps[:, 0], gaps[:, 1]) * 1000 < tolerance_mm]
+    if len(merged) == 0:
+        return waypoints, stroke_index, 0
+
+    keep = ones(len(waypoints), bool)
+    keep[merged] = False
+    keep[merged + 1] = False
+    # Renumber the strokes, a joined stroke takes the index of the previous one
+    joined = zeros(stroke_index.max() + 1, int64)
+    joined[stroke_index[merged + 1]] = 1
+    renumbered = where(
+        stroke_index >= 0, stroke_index - cumsum(joined)[stroke_index], -1
+    )
+    return waypoints[keep], renumbered[keep], len(merged)
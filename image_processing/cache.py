@@ -0,0 +1,212 @@
+"""
+Cache of the results of the image processing pipelines, keyed by the content of the
+input image and the parameters, so a setting already computed on the same photo is
+shown again without running the pipeline.
+"""
+
+from collections import OrderedDict
+from hashlib import sha1
+from os import listdir, makedirs, path, remove, replace, stat, utime
+from threading import Lock, get_ident
+from numpy import ascontiguousarray, load, ndarray, savez_compressed
+
+# Part of every key, to bump when the pipelines or the format of their results change
+# so the results stored on disk by an older version are never served
+CACHE_VERSION = 1
+
+
+class ResultCache:
+    """
+    LRU cache of pipeline results bounded in memory, with an optional disk tier.
+
+    A result is a tuple of arrays and numbers. The least recently used results are
+    dropped once the arrays take more than max_bytes. With a directory, the results
+    put with persist are also written there as compressed .npz files, and a result
+    missing from memory is loaded back from it. The files of the directory are
+    listed once, then their total size is kept up to date at every write.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 2**20,
+        directory: str = None,
+        max_disk_bytes: int = 2**30,
+    ):
+        """
+        Args:
+            max_bytes (int): The memory bound of the cached arrays.
+            directory (str): If given, the directory of the disk tier.
+            max_disk_bytes (int): The size bound of the disk tier, the oldest files
+                are deleted beyond it.
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+        # Size of the files of the disk tier by path, least recently used first,
+        # listed at the first write
+        self.disk_files = None
+        self.disk_size = 0
+        if directory is not None:
+            makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(image: ndarray, **params) -> str:
+        """
+        Build the key of a result from its input image, all its parameters and
+        CACHE_VERSION.
+
+        Every setting the result depends on must be given, including the ones read
+        from the environment like the pen height.
+
+        Args:
+            image (ndarray): The input image.
+            **params: The parameters of the pipeline, of any type with a stable repr.
+
+        Returns:
+            str: The hexadecimal key.
+        """
+        digest = sha1(f"v{CACHE_VERSION}".encode())
+        image = ascontiguousarray(image)
+        digest.update(repr((image.shape, image.dtype.str)).encode())
+        digest.update(image.data)
+        digest.update(repr(sorted(params.items())).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """
+        Return the result stored under a key, or None.
+
+        Args:
+            key (str): The key given by ResultCache.key.
+
+        Returns:
+            tuple: The result, or None if it is not cached.
+        """
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+        value = self._load(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, value)
+        return value
+
+    def put(self, key: str, value: tuple, persist: bool = True) -> None:
+        """
+        Store a result.
+
+        Args:
+            key (str): The key given by ResultCache.key.
+            value (tuple): The result, a tuple of arrays and numbers.
+            persist (bool): If False, the result is only kept in memory, for the
+                short-lived ones not worth a write.
+        """
+        value = tuple(value)
+        with self.lock:
+            self._insert(key, value)
+        if persist:
+            self._save(key, value)
+
+    def get_or_compute(self, key: str, compute) -> tuple:
+        """
+        Return the result stored under a key, computing and storing it if needed.
+
+        Args:
+            key (str): The key given by ResultCache.key.
+            compute (callable): Called without argument to compute the result.
+
+        Returns:
+            tuple: The result.
+        """
+        value = self.get(key)
+        if value is None:
+            value = tuple(compute())
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        """Empty the memory tier, the disk tier is kept."""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _insert(self, key: str, value: tuple) -> None:
+        if key in self.entries:
+            self.size -= _nbytes(self.entries.pop(key))
+        self.entries[key] = value
+        self.size += _nbytes(value)
+        # Always keep the newest result, even if it is bigger than the bound
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.size -= _nbytes(old)
+
+    def _path(self, key: str) -> str:
+        return path.join(self.directory, key + ".npz")
+
+    def _load(self, key: str):
+        if self.directory is None or not path.exists(self._path(key)):
+            return None
+        try:
+            with load(self._path(key)) as data:
+                items = [data[f"arr_{i}"] for i in range(len(data.files))]
+            # Mark the file as recently used for the eviction of the disk tier
+            utime(self._path(key))
+        except (OSError, ValueError, KeyError):
+            return None
+        with self.lock:
+            if self.disk_files is not None and self._path(key) in self.disk_files:
+                self.disk_files.move_to_end(self._path(key))
+        # Numbers are stored as 0-d arrays
+        return tuple(item.item() if item.ndim == 0 else item for item in items)
+
+    def _save(self, key: str, value: tuple) -> None:
+        if self.directory is None:
+            return
+        # Write to a temporary file first so a reader never sees half a file
+        temporary = f"{self._path(key)}.{get_ident()}.tmp"
+        with open(temporary, "wb") as f:
+            savez_compressed(f, *value)
+        replace(temporary, self._path(key))
+        with self.lock:
+            if self.disk_files is None:
+                self._list_disk()
+            self.disk_size -= self.disk_files.pop(self._path(key), 0)
+            self.disk_files[self._path(key)] = stat(self._path(key)).st_size
+            self.disk_size += self.disk_files[self._path(key)]
+            self._evict_disk()
+
+    def _list_disk(self) -> None:
+        files = [
+            path.join(self.directory, name)
+            for name in listdir(self.directory)
+            if name.endswith(".npz")
+        ]
+        files = sorted((stat(f).st_mtime, stat(f).st_size, f) for f in files)
+        self.disk_files = OrderedDict((f, size) for _, size, f in files)
+        self.disk_size = sum(self.disk_files.values())
+
+    def _evict_disk(self) -> None:
+        # Always keep the newest file, like the memory tier
+        while self.disk_size > self.max_disk_bytes and len(self.disk_files) > 1:
+            f, size = self.disk_files.popitem(last=False)
+            self.disk_size -= size
+            try:
+                remove(f)
+            except OSError:
+                pass
+
+
+def _nbytes(value: tuple) -> int:
+    """Return the memory taken by the arrays of a result."""
+    return sum(item.nbytes for item in value if isinstance(item, ndarray)) + 64
@@ -30,7 +30,12 @@ from imutils import resize
 user_defined_contours = []
 
 
-def scan_detection(image):
+def scan_detection(image, interactive=True):
+    """Find the 4 corners of the sheet of paper in an image
+    :param image: the BGR image
+    :param interactive: if no 4 corners are detected, ask the user to click them when True,
+    raise a ValueError when False, e.g. without a display
+    """
     WIDTH = 1280
     HEIGHT = 720
     global user_defined_contours
@@ -64,6 +69,8 @@ def scan_detection(image):
                 document_contour = approx
                 max_area = area
             else:
+                if not interactive:
+                    raise ValueError("no sheet of paper with 4 corners detected")
                 cv2_image = resize(image, height=640)
                 namedWindow("Select 4 Points and click on 'X'")
                 
@@ -79,6 +86,9 @@ def scan_detection(image):
 
                 # Transform the user defined points into a numpy array which openCV expects
                 document_contour = array(user_defined_contours)
+    if not interactive and max_area == 0:
+        # the biggest contour is too small to be the sheet
+        raise ValueError("no sheet of paper detected")
     return document_contour
 
 
@@ -3,18 +3,60 @@ This script is based on the Linedraw project from https://github.com/LingDong-/l
 It provides functions to convert images into line drawings.
 """
 
+from bisect import bisect_left
+from concurrent.futures import Executor, ProcessPoolExecutor
+from os import cpu_count
 from PIL import Image, ImageOps
-from numpy import array, frombuffer, uint8
+from numpy import (
+    arange,
+    array,
+    bincount,
+    concatenate,
+    cumsum,
+    diff,
+    empty,
+    float32,
+    full,
+    int8,
+    lexsort,
+    ndarray,
+    nonzero,
+    repeat,
+    zeros,
+)
 from cv2 import Canny, GaussianBlur
-import matplotlib.pyplot as plt
 try:
     import image_processing.perlin as perlin
 except:
     import perlin
 try:
-    from image_processing.A4_calibration import fit_to_a4
+    from image_processing.A4_calibration import fit_to_a4_array, merge_pen_lifts
 except:
-    from A4_calibration import fit_to_a4
+    from A4_calibration import fit_to_a4_array, merge_pen_lifts
+try:
+    from image_processing.stroke_order import order_strokes
+except:
+    from stroke_order import order_strokes
+try:
+    from image_processing.stroke_chain import chain_strokes
+except:
+    from stroke_chain import chain_strokes
+try:
+    from image_processing.strokes import Strokes
+except:
+    from strokes import Strokes
+try:
+    from image_processing.preview import render_preview
+except:
+    from preview import render_preview
+try:
+    from image_processing.timing import StageTimer
+except:
+    from timing import StageTimer
+try:
+    from image_processing.simplify import simplify_to_budget
+except:
+    from simplify import simplify_to_budget
 
 
 def distsum(*args: tuple) -> float:
@@ -43,6 +85,8 @@ def visualize(lines: list) -> None:
     Args:
         lines (list): A list of lines, where each line is a list of (x, y) coordinates.
     """
+    import matplotlib.pyplot as plt
+
     plt.figure()
     for line in lines:
         x, y = zip(*line)
@@ -51,19 +95,29 @@ def visualize(lines: list) -> None:
     plt.show()
 
 
-def sortlines(lines: list, verbose: bool = False) -> list:
+def sortlines(lines, verbose: bool = False, method: str = "index"):
     """
     Sort lines to optimize the drawing sequence.
 
     Args:
-        lines (list): A list of lines, where each line is a list of (x, y) coordinates.
+        lines (list | Strokes): A list of lines, where each line is a list of (x, y)
+            coordinates, or Strokes.
         verbose (bool): If True, print progress messages.
+        method (str): "index" uses the spatial index of stroke_order and also starts
+            closed lines from their nearest vertex, "naive" scans every remaining line
+            at each step. Without closed lines both give the same sequence.
 
     Returns:
-        list: A sorted list of lines.
+        list | Strokes: The sorted lines, in the same format as the input.
     """
+    if method == "index":
+        return order_strokes(lines, verbose)
+    if isinstance(lines, Strokes):
+        return Strokes.from_lists(sortlines(lines.to_lists(), verbose, method))
     if verbose:
         print("optimizing stroke sequence...")
+    if len(lines) == 0:
+        return []
     clines = lines[:]
     slines = [clines.pop(0)]
     while clines != []:
@@ -74,7 +128,7 @@ def sortlines(lines: list, verbose: bool = False) -> list:
             if d < s:
                 x, s, r = l[:], d, False
             if dr < s:
-                x, s, r = l[:], s, True
+                x, s, r = l[:], dr, True
 
         clines.remove(x)
         if r == True:
@@ -83,6 +137,37 @@ def sortlines(lines: list, verbose: bool = False) -> list:
     return slines
 
 
+def jitter(lines, amplitude: float, drift: int = 0) -> Strokes:
+    """
+    Offset every point with Perlin noise to give the lines a hand-drawn look.
+
+    The noise of the j-th point of the i-th line is sampled at (i * 0.5, j * 0.1),
+    for all the points at once.
+
+    Args:
+        lines (list | Strokes): A list of lines, where each line is a list of (x, y)
+            coordinates, or Strokes.
+        amplitude (float): The maximal offset of a point.
+        drift (int): Extra upward shift added at each point along a line.
+
+    Returns:
+        Strokes: The jittered lines, with integer coordinates.
+    """
+    strokes = Strokes.from_lists(lines)
+    points = strokes.points.astype(float)
+    i = strokes.stroke_index()
+    j = arange(len(points)) - repeat(strokes.offsets[:-1], strokes.lengths)
+
+    jittered = empty(points.shape, float32)
+    jittered[:, 0] = (
+        points[:, 0] + amplitude * perlin.noise(i * 0.5, j * 0.1, 1)
+    ).astype(int)
+    jittered[:, 1] = (
+        points[:, 1] + amplitude * perlin.noise(i * 0.5, j * 0.1, 2)
+    ).astype(int) - j * drift
+    return Strokes(jittered, strokes.offsets)
+
+
 def find_edges(IM: Image, verbose: bool = False) -> Image:
     """
     Detect edges in an image using Gaussian blur and Canny edge detection.
@@ -103,6 +188,48 @@ def find_edges(IM: Image, verbose: bool = False) -> Image:
     return IM.point(lambda p: p > 128 and 255)
 
 
+def maskruns(mask: ndarray) -> tuple:
+    """
+    Find the maximal horizontal runs of True values of a boolean array.
+
+    Args:
+        mask (ndarray): A 2D boolean array.
+
+    Returns:
+        tuple: The row, first column and end column (exclusive) of every run,
+        as arrays sorted by row then column.
+    """
+    h, w = mask.shape
+    padded = zeros((h, w + 2), int8)
+    padded[:, 1 : w + 1] = mask
+    steps = diff(padded, axis=1)
+    rows, starts = nonzero(steps == 1)
+    ends = nonzero(steps == -1)[1]
+    return rows, starts, ends
+
+
+def runs(PX: ndarray) -> list:
+    """
+    Run-length encode the white pixels of each row of an edge array.
+
+    Args:
+        PX (ndarray): The edge array, 255 for edge pixels.
+
+    Returns:
+        list: For each row but the last, a list of (x, length - 1) runs,
+        in the format expected by connectdots.
+    """
+    h, w = PX.shape
+    if h < 2 or w < 2:
+        return [[] for _ in range(h - 1)]
+    # The first column and the last row are ignored, like the original pixel scan
+    ys, starts, ends = maskruns(PX[: h - 1, 1:] == 255)
+
+    dots = list(zip((starts + 1).tolist(), (ends - starts - 1).tolist()))
+    offsets = concatenate(([0], bincount(ys, minlength=h - 1).cumsum())).tolist()
+    return [dots[offsets[y] : offsets[y + 1]] for y in range(h - 1)]
+
+
 def getdots(IM: Image, verbose: bool = False) -> list:
     """
     Extract contour points from an image.
@@ -116,28 +243,17 @@ def getdots(IM: Image, verbose: bool = False) -> list:
     """
     if verbose:
         print("getting contour points...")
-    PX = IM.load()
-    dots = []
-    w, h = IM.size
-    for y in range(h - 1):
-        row = []
-        for x in range(1, w):
-            if PX[x, y] == 255:
-                if len(row) > 0:
-                    if x - row[-1][0] == row[-1][-1] + 1:
-                        row[-1] = (row[-1][0], row[-1][-1] + 1)
-                    else:
-                        row.append((x, 0))
-                else:
-                    row.append((x, 0))
-        dots.append(row)
-    return dots
+    return runs(array(IM))
 
 
 def connectdots(dots: list, verbose: bool = False) -> list:
     """
     Connect contour points to form contours.
 
+    Each run is appended to the contour ending on the closest run of the previous
+    row (at most 3 pixels away), otherwise it starts a new contour. Contours that
+    are not continued and have fewer than 4 points are dropped.
+
     Args:
         dots (list): A list of contour points.
         verbose (bool): If True, print progress messages.
@@ -148,42 +264,63 @@ def connectdots(dots: list, verbose: bool = False) -> list:
     if verbose:
         print("connecting contour points...")
     contours = []
+    dropped = set()
+    # x position of the tail on the previous row -> index of the open contour
+    tails = {}
+    last = len(dots) - 1
     for y in range(len(dots)):
+        row_tails = {}
+        prev = [x0 for x0, _ in dots[y - 1]] if y > 0 else []
         for x, v in dots[y]:
-            if v > -1:
-                if y == 0:
-                    contours.append([(x, y)])
+            if v < 0:
+                continue
+            c = None
+            if prev:
+                # closest run of the previous row, the leftmost one on a tie
+                i = bisect_left(prev, x)
+                if i == len(prev) or (i > 0 and x - prev[i - 1] <= prev[i] - x):
+                    closest = prev[i - 1]
                 else:
-                    closest = -1
-                    cdist = 100
-                    for x0, v0 in dots[y - 1]:
-                        if abs(x0 - x) < cdist:
-                            cdist = abs(x0 - x)
-                            closest = x0
-
-                    if cdist > 3:
-                        contours.append([(x, y)])
-                    else:
-                        found = 0
-                        for i in range(len(contours)):
-                            if contours[i][-1] == (closest, y - 1):
-                                contours[i].append(
-                                    (
-                                        x,
-                                        y,
-                                    )
-                                )
-                                found = 1
-                                break
-                        if found == 0:
-                            contours.append([(x, y)])
-        for c in contours:
-            if c[-1][1] < y - 1 and len(c) < 4:
-                contours.remove(c)
-    return contours
-
-
-def getcontours(IM: Image, sc: int = 2, verbose: bool = False) -> list:
+                    closest = prev[i]
+                if abs(closest - x) <= 3:
+                    c = tails.pop(closest, None)
+            if c is None:
+                c = len(contours)
+                contours.append([(x, y)])
+            else:
+                contours[c].append((x, y))
+            row_tails[x] = c
+
+        # The contours left over can't be continued anymore
+        if y < last:
+            for c in tails.values():
+                if len(contours[c]) < 4:
+                    dropped.add(c)
+        tails = row_tails
+
+    return [contours[i] for i in range(len(contours)) if i not in dropped]
+
+
+def scancontours(PX: ndarray, transposed: bool = False) -> list:
+    """
+    Connect the runs of an edge array scanned along its rows or its columns.
+
+    Args:
+        PX (ndarray): The edge array, as returned by find_edges.
+        transposed (bool): If True, scan the columns instead of the rows.
+
+    Returns:
+        list: A list of contours, in the coordinates of the edge array.
+    """
+    if not transposed:
+        return connectdots(runs(PX))
+    contours = connectdots(runs(PX.T))
+    return [[(c[1], c[0]) for c in contour] for contour in contours]
+
+
+def getcontours(
+    IM: Image, sc: int = 2, verbose: bool = False, pool: Executor = None
+) -> Strokes:
     """
     Generate contours from an image.
 
@@ -191,30 +328,25 @@ def getcontours(IM: Image, sc: int = 2, verbose: bool = False) -> list:
         IM (Image): The input image.
         sc (int): Scale factor for the contours.
         verbose (bool): If True, print progress messages.
+        pool (Executor): If given, the two scan directions run in parallel on it.
 
     Returns:
-        list: A list of contours.
+        Strokes: The contours.
     """
     if verbose:
         print("generating contours...")
-    IM = find_edges(IM)
-    IM1 = IM.copy()
-    IM2 = IM.rotate(-90, expand=True).transpose(Image.FLIP_LEFT_RIGHT)
-    dots1 = getdots(IM1)
-    contours1 = connectdots(dots1)
-    dots2 = getdots(IM2)
-    contours2 = connectdots(dots2)
-
-    for i in range(len(contours2)):
-        contours2[i] = [(c[1], c[0]) for c in contours2[i]]
+    # The transposed scan is the same as scanning the image rotated and mirrored
+    PX = array(find_edges(IM))
+    if pool is not None:
+        scans = [
+            pool.submit(scancontours, PX, transposed) for transposed in (False, True)
+        ]
+        contours1, contours2 = [scan.result() for scan in scans]
+    else:
+        contours1, contours2 = scancontours(PX), scancontours(PX, True)
     contours = contours1 + contours2
 
-    for i in range(len(contours)):
-        for j in range(len(contours)):
-            if len(contours[i]) > 0 and len(contours[j]) > 0:
-                if distsum(contours[j][0], contours[i][-1]) < 8:
-                    contours[i] = contours[i] + contours[j]
-                    contours[j] = []
+    contours = chain_strokes(contours, 8)
 
     for i in range(len(contours)):
         contours[i] = [contours[i][j] for j in range(0, len(contours[i]), 8)]
@@ -224,16 +356,10 @@ def getcontours(IM: Image, sc: int = 2, verbose: bool = False) -> list:
     for i in range(0, len(contours)):
         contours[i] = [(v[0] * sc, v[1] * sc) for v in contours[i]]
 
-    for i in range(0, len(contours)):
-        for j in range(0, len(contours[i])):
-            contours[i][j] = int(
-                contours[i][j][0] + 10 * perlin.noise(i * 0.5, j * 0.1, 1)
-            ), int(contours[i][j][1] + 10 * perlin.noise(i * 0.5, j * 0.1, 2))
-
-    return contours
+    return jitter(contours, 10)
 
 
-def hatch(IM: Image, sc=16, verbose=False) -> list:
+def hatch(IM: Image, sc=16, verbose=False) -> Strokes:
     """
     Generate hatching lines for an image.
 
@@ -243,10 +369,24 @@ def hatch(IM: Image, sc=16, verbose=False) -> list:
         verbose (bool): If True, print progress messages.
 
     Returns:
-        list: A list of hatching lines.
+        Strokes: The hatching lines.
     """
     if verbose:
         print("hatching...")
+    return jitter(hatchsegments(IM, sc), sc, 1)
+
+
+def hatchsegments(IM: Image, sc: int = 16) -> list:
+    """
+    Build the hatching lines of hatch, one segment per cell joined afterwards, without noise.
+
+    Args:
+        IM (Image): The input image.
+        sc (int): Scale factor for the hatching lines.
+
+    Returns:
+        list: A list of hatching lines.
+    """
     PX = IM.load()
     w, h = IM.size
     lg1 = []
@@ -269,24 +409,103 @@ def hatch(IM: Image, sc=16, verbose=False) -> list:
                 lg1.append([(x, y + sc / 2 + sc / 4), (x + sc, y + sc / 2 + sc / 4)])
                 lg2.append([(x + sc, y), (x, y + sc)])
 
-    lines = [lg1, lg2]
-    for k in range(0, len(lines)):
-        for i in range(0, len(lines[k])):
-            for j in range(0, len(lines[k])):
-                if lines[k][i] != [] and lines[k][j] != []:
-                    if lines[k][i][-1] == lines[k][j][0]:
-                        lines[k][i] = lines[k][i] + lines[k][j][1:]
-                        lines[k][j] = []
-        lines[k] = [l for l in lines[k] if len(l) > 0]
-    lines = lines[0] + lines[1]
-
-    for i in range(0, len(lines)):
-        for j in range(0, len(lines[i])):
-            lines[i][j] = (
-                int(lines[i][j][0] + sc * perlin.noise(i * 0.5, j * 0.1, 1)),
-                int(lines[i][j][1] + sc * perlin.noise(i * 0.5, j * 0.1, 2)) - j,
-            )
-    return lines
+    return chain_strokes(lg1, shared=True) + chain_strokes(lg2, shared=True)
+
+
+def hatchstrokes(IM: Image, sc: int = 16) -> list:
+    """
+    Build the hatching lines of an image from the runs of each tone band, without noise.
+
+    Gives the same lines as hatchsegments: horizontal lines for the pixels darker than
+    144 (a second one below 16) and diagonal lines below 64, but every maximal run of
+    pixels is found with array operations and emitted directly as one stroke.
+
+    Args:
+        IM (Image): The input image.
+        sc (int): Scale factor for the hatching lines.
+
+    Returns:
+        list: A list of hatching lines.
+    """
+    PX = array(IM)
+    h, w = PX.shape
+
+    # Horizontal runs: (rank, row, first cell, number of cells, y offset)
+    bands = []
+    for rank, (level, dy) in enumerate(((144, sc / 4), (16, sc / 2 + sc / 4))):
+        rows, starts, ends = maskruns(PX <= level)
+        bands.append((full(len(rows), rank), rows, starts, ends - starts, dy))
+    rank = concatenate([band[0] for band in bands])
+    rows = concatenate([band[1] for band in bands])
+    starts = concatenate([band[2] for band in bands])
+    counts = concatenate([band[3] for band in bands])
+    dys = concatenate([full(len(band[0]), band[4]) for band in bands])
+    order = lexsort((rank, rows, starts))
+    horizontal = runpoints(
+        starts[order] * sc, rows[order] * sc + dys[order], counts[order], sc, 0
+    )
+
+    # Diagonal runs go down-left, along the anti-diagonals x + y = d of the image
+    ys, xs = nonzero(PX <= 64)
+    sheared = zeros((h + w - 1, h), bool)
+    sheared[xs + ys, ys] = True
+    diagonals, starts, ends = maskruns(sheared)
+    first_x = diagonals - starts
+    order = lexsort((starts, first_x))
+    diagonal = runpoints(
+        (first_x[order] + 1) * sc, starts[order] * sc, (ends - starts)[order], -sc, sc
+    )
+    return horizontal + diagonal
+
+
+def runpoints(x0: ndarray, y0: ndarray, counts: ndarray, dx: float, dy: float) -> list:
+    """
+    Build straight lines made of one point per cell boundary.
+
+    Args:
+        x0 (ndarray): The x coordinate of the start of every line.
+        y0 (ndarray): The y coordinate of the start of every line.
+        counts (ndarray): The number of cells crossed by every line.
+        dx (float): The x step from one point to the next.
+        dy (float): The y step from one point to the next.
+
+    Returns:
+        list: A list of lines, where each line is a list of (x, y) coordinates.
+    """
+    lengths = counts + 1
+    offsets = concatenate(([0], cumsum(lengths)))
+    k = arange(offsets[-1]) - repeat(offsets[:-1], lengths)
+    xs = repeat(x0, lengths) + k * dx
+    ys = repeat(y0, lengths) + k * dy
+    points = list(zip(xs.tolist(), ys.tolist()))
+    offsets = offsets.tolist()
+    return [points[offsets[i] : offsets[i + 1]] for i in range(len(counts))]
+
+
+_pool = None
+_pool_workers = None
+
+
+def processpool(workers: int = None) -> ProcessPoolExecutor:
+    """
+    Return the pool of processes used by the parallel sketch, created on first use.
+
+    The pool is kept between calls so the workers are only started once.
+
+    Args:
+        workers (int): The number of processes, all the cores by default.
+
+    Returns:
+        ProcessPoolExecutor: The shared pool.
+    """
+    global _pool, _pool_workers
+    workers = workers or cpu_count() or 1
+    if _pool is None or _pool_workers != workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
 
 
 def sketch(
@@ -297,7 +516,14 @@ def sketch(
     resolution: int = 2048,
     hatch_size: int = 16,
     contour_simplify: int = 2,
-) -> list:
+    sort_method: str = "index",
+    seed: int = None,
+    hatch_method: str = "runs",
+    parallel: bool = False,
+    workers: int = None,
+    stats: dict = None,
+    max_points: int = None,
+) -> Strokes:
     """
     Generate a sketch from an image by combining contours and hatching.
 
@@ -309,33 +535,64 @@ def sketch(
         resolution (int): Resolution of the output sketch.
         hatch_size (int): Size of the hatching lines.
         contour_simplify (int): Simplification factor for contours.
+        sort_method (str): The stroke ordering method, see sortlines.
+        seed (int): If given, seed the Perlin noise so the sketch is reproducible.
+        hatch_method (str): "runs" emits each run of a tone band as one stroke
+            (hatchstrokes), "cells" builds one segment per cell and joins them
+            afterwards (hatchsegments).
+        parallel (bool): If True, the hatching and both contour scans run at the same time
+            in a pool of processes. The output is the same as the serial one.
+        workers (int): The number of processes of the pool, all the cores by default.
+        stats (dict): If given, receives the time spent in each stage under "timings".
+        max_points (int): If given, the least significant points are removed until the
+            robot path fits this number of waypoints, see simplify_to_budget.
 
     Returns:
-        list: A list of lines representing the sketch.
+        Strokes: The lines representing the sketch.
     """
+    timer = StageTimer(stats)
     w, h = IM.size
+    if seed is not None:
+        perlin.noiseSeed(seed)
 
     IM = IM.convert("L")
     IM = ImageOps.autocontrast(IM, 10)
 
-    lines = []
+    pool = processpool(workers) if parallel else None
+    hatcher = hatchstrokes if hatch_method == "runs" else hatchsegments
+    if draw_hatch:
+        IMh = IM.resize((resolution // hatch_size, resolution // hatch_size * h // w))
+        if pool is not None:
+            hatching = pool.submit(hatcher, IMh, hatch_size)
+
+    parts = []
     if draw_contours:
-        lines += getcontours(
-            IM.resize(
-                (
-                    resolution // contour_simplify,
-                    resolution // contour_simplify * h // w,
-                )
-            ),
-            contour_simplify,
+        parts.append(
+            getcontours(
+                IM.resize(
+                    (
+                        resolution // contour_simplify,
+                        resolution // contour_simplify * h // w,
+                    )
+                ),
+                contour_simplify,
+                pool=pool,
+            )
         )
+        timer.lap("contours")
     if draw_hatch:
-        lines += hatch(
-            IM.resize((resolution // hatch_size, resolution // hatch_size * h // w)),
-            hatch_size,
-        )
+        # The noise is always applied here so the workers' tables don't matter
+        hatching = hatching.result() if pool is not None else hatcher(IMh, hatch_size)
+        parts.append(jitter(hatching, hatch_size, 1))
+        timer.lap("hatch")
 
-    lines = sortlines(lines)
+    lines = Strokes.concat(parts)
+    if max_points is not None:
+        lines = simplify_to_budget(lines, max_points)
+        timer.lap("simplify")
+
+    lines = sortlines(lines, method=sort_method)
+    timer.lap("order")
 
     if verbose:
         print(len(lines), "strokes.")
@@ -343,35 +600,45 @@ def sketch(
     return lines
 
 
-def output(IM: Image, preview: bool = False):
+def output(
+    IM: Image,
+    preview: bool = False,
+    preview_size: tuple = None,
+    stats: dict = None,
+    max_points: int = None,
+    lift_tolerance_mm: float = 0.5,
+):
     """
     Generate and optionally preview the output trajectory and number of points from an image.
 
     Args:
         IM (Image): The input image to be processed.
         preview (bool): If True, generate a preview of the line drawing.
+        preview_size (tuple): The (width, height) of the preview, the size of the image by default.
+        stats (dict): If given, receives the time spent in each stage under "timings".
+        max_points (int): If given, the maximum number of waypoints of the trajectory.
+        lift_tolerance_mm (float): Consecutive strokes closer than this, in mm, are drawn
+            without lifting the pen, see merge_pen_lifts.
 
     Returns:
         tuple: A tuple containing:
-            - trajectory (str): The trajectory of the lines in the image.
+            - trajectory (ndarray): The (N, 6) waypoints of the robot, see fit_to_a4_array.
             - nb_points (int): The total number of points in the lines.
             - previsualisation (ndarray, optional): A numpy array representing the preview of the line drawing,
               only returned if preview is True.
     """
-    lines = sketch(IM)
-    nb_points = sum([len(line) for line in lines])
-    trajectory = fit_to_a4(lines, IM.size[1], IM.size[0])
+    lines = sketch(IM, stats=stats, max_points=max_points)
+    timer = StageTimer(stats)
+    nb_points = lines.num_points
+    trajectory, stroke_index = fit_to_a4_array(lines, IM.size[1], IM.size[0])
+    trajectory, _, lifts_removed = merge_pen_lifts(
+        trajectory, stroke_index, lift_tolerance_mm
+    )
+    if stats is not None:
+        stats["lifts_removed"] = lifts_removed
+    timer.lap("fit")
     if preview:
-        plt.figure()
-        for line in lines:
-            x, y = zip(*line)
-            plt.plot(x, y, color="black")
-        plt.gca().invert_yaxis()
-        plt.axis("off")
-
-        canvas = plt.gca().figure.canvas
-        canvas.draw()
-        data = frombuffer(canvas.tostring_rgb(), dtype=uint8)
-        previsualisation = data.reshape(canvas.get_width_height()[::-1] + (3,))
+        previsualisation = render_preview(lines, preview_size or IM.size)
+        timer.lap("preview")
         return trajectory, nb_points, previsualisation
     return trajectory, nb_points
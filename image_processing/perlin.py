@@ -1,7 +1,8 @@
 #Perlin Noise
 #Based on Javascript from p5.js (https://github.com/processing/p5.js/blob/master/src/math/noise.js)
+#Evaluated on NumPy arrays so a whole stroke is jittered in one call
 
-from math import cos, pi
+from numpy import abs as npabs, array, asarray, broadcast_arrays, cos, int64, isscalar, pi, zeros
 from random import random
 
 PERLIN_YWRAPB = 4
@@ -19,25 +20,26 @@ def scaled_cosine(i):
 perlin = None
 
 def noise(x,y=0,z=0):
+    """
+    Evaluate the noise at the given coordinates.
+
+    x, y and z can be numbers or arrays (broadcast together). A float is returned
+    for numbers and an array of the broadcast shape otherwise.
+    """
     global perlin
-    if perlin == None:
-        perlin = []
-        for i in range(0,PERLIN_SIZE+1):
-            perlin.append(random())
-    if x<0:x=-x
-    if y<0:y=-y
-    if z<0:z=-z
-    
-    xi,yi,zi = int(x),int(y),int(z)
+    if perlin is None:
+        perlin = array([random() for i in range(0,PERLIN_SIZE+1)])
+    scalar = isscalar(x) and isscalar(y) and isscalar(z)
+    x,y,z = broadcast_arrays(npabs(asarray(x,float)),npabs(asarray(y,float)),npabs(asarray(z,float)))
+
+    xi,yi,zi = x.astype(int64),y.astype(int64),z.astype(int64)
     xf = x-xi
     yf = y-yi
     zf = z-zi
-    rxf = ryf = None
-    
-    r = 0
+
+    r = zeros(x.shape)
     ampl = 0.5
-    
-    n1 = n2 = n3 = None
+
     for o in range(0,perlin_octaves):
         of=xi+(yi<<PERLIN_YWRAPB)+(zi<<PERLIN_ZWRAPB)
 
@@ -61,42 +63,44 @@ def noise(x,y=0,z=0):
 
         r += n1*ampl
         ampl *= perlin_amp_falloff
-        xi<<=1
-        xf*=2
-        yi<<=1
-        yf*=2
-        zi<<=1
-        zf*=2
-        
-        if (xf>=1.0): xi+=1; xf-=1
-        if (yf>=1.0): yi+=1; yf-=1
-        if (zf>=1.0): zi+=1; zf-=1      
+        xi = xi<<1
+        xf = xf*2
+        yi = yi<<1
+        yf = yf*2
+        zi = zi<<1
+        zf = zf*2
+
+        carry = xf>=1.0; xi += carry; xf -= carry
+        carry = yf>=1.0; yi += carry; yf -= carry
+        carry = zf>=1.0; zi += carry; zf -= carry
+    if scalar:
+        return float(r)
     return r
-        
+
 def noiseDetail(lod, falloff):
+    global perlin_octaves, perlin_amp_falloff
     if lod>0:perlin_octaves=lod
-    if falloff>0:perlin_amp_falloff=falloff 
-    
-    
+    if falloff>0:perlin_amp_falloff=falloff
+
+
 class LCG():
     def __init__(self):
         self.m = 4294967296.0
         self.a = 1664525.0
-        self.c = 1013904223.0   
+        self.c = 1013904223.0
         self.seed = self.z = None
     def setSeed(self,val=None):
-        self.z = self.seed = (random()*self.m if val == None else val) >> 0
+        self.z = self.seed = int(random()*self.m if val == None else val)
     def getSeed(self):
         return self.seed
     def rand(self):
         self.z = (self.a * self.z + self.c) % self.m
-        return self.z/self.m        
-        
-    
+        return self.z/self.m
+
+
 def noiseSeed(seed):
+    """Fill the permutation table from a seed so the noise is reproducible."""
+    global perlin
     lcg = LCG()
     lcg.setSeed(seed)
-    perlin = []
-    for i in range(0,PERLIN_SIZE+1):
-        perlin.append(lcg.rand())
-
+    perlin = array([lcg.rand() for i in range(0,PERLIN_SIZE+1)])
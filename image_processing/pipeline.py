@@ -0,0 +1,201 @@
+"""
+Stages of trajectory_computation, memoized for the GUI.
+
+The pipeline is split into stages, each remembering its last inputs and output.
+When a parameter changes, only the stages from the first one depending on it are
+executed again, the others give back their last output. trajectory_computation
+runs a new pipeline once, so both always go through the same stages.
+"""
+
+from threading import Lock
+from cv2 import INTER_AREA, resize
+from numpy import ndarray
+
+try:
+    from image_processing import image_scanner
+    from image_processing.cache import ResultCache
+    from image_processing.preview import render_preview
+    from image_processing.timing import StageTimer
+    from image_processing.trajectory_maker import (
+        approximate_contours,
+        arrange_strokes,
+        close_edges,
+        detect_edges,
+        find_contours,
+        fit_strokes,
+        select_contours,
+        to_grayscale,
+    )
+except:
+    import image_scanner
+    from cache import ResultCache
+    from preview import render_preview
+    from timing import StageTimer
+    from trajectory_maker import (
+        approximate_contours,
+        arrange_strokes,
+        close_edges,
+        detect_edges,
+        find_contours,
+        fit_strokes,
+        select_contours,
+        to_grayscale,
+    )
+
+STAGES = [
+    "warp",
+    "gray",
+    "edges",
+    "closed",
+    "contours",
+    "simplified",
+    "deduped",
+    "ordered",
+    "fitted",
+    "preview",
+]
+
+
+class TrajectoryPipeline:
+    """
+    trajectory_computation with every stage memoized on its own inputs.
+
+    The key of a stage is the key of the stage before it plus its own parameters, so
+    a stage is reused exactly when nothing upstream of it changed. Only the last run
+    is remembered, which is what a slider needs.
+    """
+
+    def __init__(self):
+        self.memo = {}
+        self.reused = []
+        self.lock = Lock()
+
+    def run(
+        self,
+        image: ndarray,
+        epsilon=2,
+        method="bluredcanny",
+        order="area",
+        preview_size=(640, 480),
+        crop=False,
+        max_size=None,
+        prune_twins=True,
+        max_points=None,
+        lift_tolerance_mm=0.5,
+        report_travel=False,
+        stats=None,
+    ):
+        """
+        Compute the trajectory of an image, reusing the stages whose inputs didn't change.
+
+        Args:
+            image (ndarray): The photo.
+            epsilon (float): The approximation of the contours, in pixels of the photo.
+            method (str): The edge detection, see trajectory_computation.
+            order (str): "area" or "nearest", see trajectory_computation.
+            preview_size (tuple): The (width, height) of the preview.
+            crop (bool): If True, the sheet of paper is detected and straightened first.
+            max_size (int): If given, the photo is downscaled to this longest side.
+            prune_twins (bool): See trajectory_computation.
+            max_points (int): See trajectory_computation.
+            lift_tolerance_mm (float): See trajectory_computation.
+            report_travel (bool): If True, stats also receives the pen-up travel of
+                the ordered strokes and the travel saved by rotating the loops, which
+                costs a second ordering.
+            stats (dict): If given, receives the timings, the stats of the stages and
+                the names of the reused stages under "reused".
+
+        Returns:
+            tuple: The waypoints, their number, the number of contours and the preview,
+            like trajectory_computation.
+        """
+        with self.lock:
+            self.reused = []
+            timer = StageTimer(stats)
+            key = (ResultCache.key(image), crop, max_size)
+
+            def stage(name, compute, *params):
+                nonlocal key
+                key = (key, params)
+                memo = self.memo.get(name)
+                if memo is not None and memo[0] == key:
+                    self.reused.append(name)
+                    value, extra = memo[1], memo[2]
+                else:
+                    extra = {}
+                    value = compute(extra)
+                    self.memo[name] = (key, value, extra)
+                if stats is not None:
+                    stats.update(extra)
+                timer.lap(name)
+                return value
+
+            warped, scale = stage("warp", lambda _: warp(image, crop, max_size))
+            gray = stage("gray", lambda _: to_grayscale(warped))
+            edges = stage("edges", lambda _: detect_edges(gray, method), method)
+            closed = stage("closed", lambda _: close_edges(edges))
+            contours = stage(
+                "contours", lambda _: find_contours(closed, prune_twins), prune_twins
+            )
+            approxes = stage(
+                "simplified",
+                lambda _: approximate_contours(contours, epsilon * scale, closed.shape),
+                epsilon,
+            )
+            strokes = stage("deduped", lambda _: select_contours(approxes))
+            report = report_travel and stats is not None
+            strokes = stage(
+                "ordered",
+                lambda extra: arrange_strokes(
+                    strokes, order, max_points, extra if report else None
+                ),
+                order,
+                max_points,
+                report,
+            )
+            points = stage(
+                "fitted",
+                lambda extra: fit_strokes(strokes, lift_tolerance_mm, extra),
+                lift_tolerance_mm,
+            )
+            preview = stage(
+                "preview",
+                lambda _: render_preview(strokes, preview_size, flip_y=True),
+                tuple(preview_size),
+            )
+            if stats is not None:
+                stats["reused"] = list(self.reused)
+            return points, len(points), len(strokes), preview
+
+    def clear(self) -> None:
+        """Forget the outputs of all the stages."""
+        with self.lock:
+            self.memo.clear()
+
+
+def warp(
+    image: ndarray, crop: bool = False, max_size: int = None, interactive: bool = True
+) -> tuple:
+    """
+    Straighten the sheet of paper of a photo and downscale it.
+
+    Args:
+        image (ndarray): The photo.
+        crop (bool): If True, the sheet is detected and straightened.
+        max_size (int): If given, the longest side of the result.
+        interactive (bool): If the sheet isn't detected, ask the user to click its
+            corners when True, raise a ValueError when False.
+
+    Returns:
+        tuple: The image and the scale applied to it.
+    """
+    if crop:
+        document_contour = image_scanner.scan_detection(image, interactive)
+        image = image_scanner.four_point_transform(
+            image, document_contour.reshape(4, 2)
+        )
+    scale = 1.0
+    if max_size is not None and max(image.shape[:2]) > max_size:
+        scale = max_size / max(image.shape[:2])
+        image = resize(image, None, fx=scale, fy=scale, interpolation=INTER_AREA)
+    return image, scale
@@ -0,0 +1,71 @@
+"""
+Raster preview of a drawing, drawn with OpenCV straight into an image of the size
+of the label showing it.
+"""
+
+from cv2 import LINE_AA, polylines
+from numpy import empty, int32, ndarray, split, stack, uint8
+
+try:
+    from image_processing.strokes import Strokes
+except:
+    from strokes import Strokes
+
+PEN_DOWN_COLOR = (0, 0, 0)
+PEN_UP_COLOR = (255, 150, 150)
+
+
+def render_preview(
+    strokes,
+    size: tuple = (640, 480),
+    flip_y: bool = False,
+    margin: int = 4,
+    show_pen_up: bool = True,
+    canvas: ndarray = None,
+) -> ndarray:
+    """
+    Draw strokes on a white RGB image, scaled to fit it while keeping the aspect ratio.
+
+    Args:
+        strokes (list | Strokes): A list of lines, where each line is a list of (x, y)
+            coordinates, or Strokes.
+        size (tuple): The (width, height) of the image.
+        flip_y (bool): If True, the y axis points up, like the coordinates of
+            trajectory_computation.
+        margin (int): The blank border around the drawing, in pixels.
+        show_pen_up (bool): If True, the moves between strokes are drawn in another colour.
+        canvas (ndarray): An (height, width, 3) uint8 image to draw into instead of
+            allocating a new one.
+
+    Returns:
+        ndarray: The preview.
+    """
+    width, height = size
+    if canvas is None:
+        canvas = empty((height, width, 3), uint8)
+    canvas[:] = 255
+
+    strokes = Strokes.from_lists(strokes)
+    if strokes.num_points == 0:
+        return canvas
+
+    points = strokes.points
+    low, high = points.min(axis=0), points.max(axis=0)
+    extent = (high - low).clip(min=1)
+    scale = min((width - 2 * margin) / extent[0], (height - 2 * margin) / extent[1])
+    # Center the drawing
+    shift = (size - extent * scale) / 2
+    pixels = ((points - low) * scale + shift).astype(int32)
+    if flip_y:
+        pixels[:, 1] = height - 1 - pixels[:, 1]
+
+    if show_pen_up and len(strokes) > 1:
+        ends = pixels[strokes.offsets[1:-1] - 1]
+        starts = pixels[strokes.offsets[1:-1]]
+        polylines(
+            canvas, stack((ends, starts), axis=1), False, PEN_UP_COLOR, 1, LINE_AA
+        )
+    polylines(
+        canvas, split(pixels, strokes.offsets[1:-1]), False, PEN_DOWN_COLOR, 1, LINE_AA
+    )
+    return canvas
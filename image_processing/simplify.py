@@ -0,0 +1,122 @@
+"""
+Simplification of a whole drawing down to a number of robot waypoints.
+
+Every waypoint is one setpoint exchanged with the robot, so the number of waypoints
+sets how long a drawing takes. The vertices are removed with Visvalingam's algorithm
+applied to all the strokes at once: the vertex forming the smallest triangle with its
+neighbours goes first, whichever stroke it belongs to.
+"""
+
+from heapq import heapify, heappop, heappush
+from numpy import abs as npabs, concatenate, cumsum, int64, ones, zeros
+
+try:
+    from image_processing.strokes import Strokes
+except:
+    from strokes import Strokes
+
+# Rough average time the robot takes per waypoint, move and handshake included
+SECONDS_PER_WAYPOINT = 0.3
+
+
+def waypoint_count(num_points: int, num_strokes: int) -> int:
+    """
+    Return the number of waypoints sent to the robot for a drawing.
+
+    fit_to_a4 adds a pen-up row before and after every stroke and the two home positions.
+
+    Args:
+        num_points (int): The number of points of the strokes.
+        num_strokes (int): The number of strokes.
+
+    Returns:
+        int: The number of waypoints.
+    """
+    return num_points + 2 * num_strokes + 2
+
+
+def estimate_duration(num_waypoints: int) -> float:
+    """Return the estimated drawing time in seconds for a number of waypoints."""
+    return num_waypoints * SECONDS_PER_WAYPOINT
+
+
+def waypoints_for_duration(seconds: float) -> int:
+    """Return the number of waypoints the robot can draw in the given time."""
+    return int(seconds / SECONDS_PER_WAYPOINT)
+
+
+def simplify_to_budget(strokes, max_waypoints: int) -> Strokes:
+    """
+    Remove the least significant vertices of a drawing until it fits a waypoint budget.
+
+    The significance of a vertex is the area of the triangle it forms with its two
+    neighbours. The first and last points of every stroke are kept, and closed strokes
+    keep at least a triangle, so the budget can't go below 2 points per stroke plus
+    the pen-up rows.
+
+    Args:
+        strokes (list | Strokes): A list of lines, where each line is a list of (x, y)
+            coordinates, or Strokes.
+        max_waypoints (int): The maximum number of waypoints, pen-up rows included.
+
+    Returns:
+        Strokes: The simplified strokes.
+    """
+    strokes = Strokes.from_lists(strokes)
+    budget = max_waypoints - waypoint_count(0, len(strokes))
+    remaining = strokes.num_points
+    if remaining <= budget:
+        return strokes
+
+    points = strokes.points.astype(float)
+    x, y = points[:, 0].tolist(), points[:, 1].tolist()
+    offsets = strokes.offsets
+    stroke_of = strokes.stroke_index().tolist()
+    # Neighbours of every vertex, -1 at the ends of the strokes
+    previous = list(range(-1, remaining - 1))
+    following = list(range(1, remaining + 1))
+    for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        previous[start] = -1
+        following[end - 1] = -1
+    closed = (npabs(strokes.starts - strokes.ends).sum(axis=1) == 0).tolist()
+    left = strokes.lengths.tolist()
+
+    def area(i: int) -> float:
+        a, b = previous[i], following[i]
+        return abs((x[a] - x[i]) * (y[b] - y[i]) - (x[b] - x[i]) * (y[a] - y[i])) / 2
+
+    # All the inner vertices, with the area computed at once
+    inner = zeros(remaining, bool)
+    inner[1:-1] = True
+    inner[offsets[1:-1] - 1] = False
+    inner[offsets[1:-1]] = False
+    index = inner.nonzero()[0]
+    before, after = points[index - 1] - points[index], points[index + 1] - points[index]
+    areas = npabs(before[:, 0] * after[:, 1] - after[:, 0] * before[:, 1]) / 2
+    current = dict(zip(index.tolist(), areas.tolist()))
+    heap = [(a, i) for i, a in current.items()]
+    heapify(heap)
+    keep = ones(remaining, bool)
+
+    while remaining > budget and heap:
+        a, i = heappop(heap)
+        if current.get(i) != a:
+            continue
+        s = stroke_of[i]
+        if left[s] <= (4 if closed[s] else 2):
+            del current[i]
+            continue
+        # Unlink the vertex and update its neighbours, never below the removed area
+        del current[i]
+        keep[i] = False
+        p, n = previous[i], following[i]
+        following[p], previous[n] = n, p
+        left[s] -= 1
+        remaining -= 1
+        for j in (p, n):
+            if j in current:
+                current[j] = max(area(j), a)
+                heappush(heap, (current[j], j))
+
+    new_offsets = concatenate(([0], cumsum(left))).astype(int64)
+    return Strokes(strokes.points[keep], new_offsets)
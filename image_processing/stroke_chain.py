@@ -0,0 +1,98 @@
+"""
+Joining of stroke fragments whose ends meet, used by linedraw to merge contour
+pieces and hatch segments into longer strokes.
+"""
+
+from math import floor
+
+
+def _find(parent: list, i: int) -> int:
+    """Return the representative of the chain containing stroke i."""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def chain_strokes(lines: list, tolerance: float = 0, shared: bool = False) -> list:
+    """
+    Chain strokes whose end lies close to the start of another one.
+
+    The start points are bucketed in a spatial hash keyed on a grid of the size of
+    the tolerance, so each stroke only looks at the starts in the neighbouring cells.
+    Every stroke is linked to at most one successor, the lowest index one within
+    the tolerance, and loops are never closed. The chains are built once, at the end.
+
+    Args:
+        lines (list): A list of lines, where each line is a list of (x, y) coordinates.
+        tolerance (float): The maximal distance between the end of a stroke and the start
+            of the next one. 0 only joins strokes whose ends are equal.
+        shared (bool): If True, the start of a joined stroke is the same point as the end
+            of the previous one and is only kept once.
+
+    Returns:
+        list: The chained lines, empty lines are removed.
+    """
+    n = len(lines)
+    if tolerance > 0:
+
+        def key(p):
+            return (floor(p[0] / tolerance), floor(p[1] / tolerance))
+
+        def neighbours(p):
+            cx, cy = key(p)
+            return [(cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+    else:
+
+        def key(p):
+            return (p[0], p[1])
+
+        def neighbours(p):
+            return [key(p)]
+
+    heads = {}
+    for i in range(n):
+        if len(lines[i]) > 0:
+            heads.setdefault(key(lines[i][0]), []).append(i)
+
+    claimed = [False] * n
+    successor = [-1] * n
+    parent = list(range(n))
+    limit = tolerance * tolerance
+    for i in range(n):
+        if len(lines[i]) == 0:
+            continue
+        tx, ty = lines[i][-1]
+        root = _find(parent, i)
+        best = -1
+        for cell in neighbours(lines[i][-1]):
+            for j in heads.get(cell, ()):
+                if claimed[j] or (best != -1 and j > best):
+                    continue
+                hx, hy = lines[j][0]
+                if tolerance > 0:
+                    if (hx - tx) ** 2 + (hy - ty) ** 2 >= limit:
+                        continue
+                elif hx != tx or hy != ty:
+                    continue
+                # Joining a stroke of the same chain would close a loop
+                if _find(parent, j) == root:
+                    continue
+                best = j
+        if best != -1:
+            successor[i] = best
+            claimed[best] = True
+            parent[_find(parent, best)] = root
+
+    chains = []
+    for i in range(n):
+        if len(lines[i]) == 0 or claimed[i]:
+            continue
+        chain = list(lines[i])
+        j = successor[i]
+        while j != -1:
+            chain.extend(lines[j][1:] if shared else lines[j])
+            j = successor[j]
+        chains.append(chain)
+    return chains
@@ -0,0 +1,247 @@
+"""
+Greedy nearest-neighbour ordering of strokes backed by a spatial grid index.
+Without loop rotation it gives the same sequence as the naive quadratic search in
+linedraw.sortlines without scanning every remaining stroke at each step.
+"""
+
+from math import floor, sqrt
+
+try:
+    from image_processing.strokes import Strokes
+except:
+    from strokes import Strokes
+
+
+class EntryIndex:
+    """
+    Uniform grid over candidate entry points with deletion and nearest-neighbour lookup.
+
+    Entries are identified by their position in the input list. Ties on the distance
+    are broken in favour of the lowest identifier, so queries are deterministic.
+    """
+
+    def __init__(self, points: list):
+        """
+        Args:
+            points (list): A list of (x, y) coordinates, one per entry.
+        """
+        self.xs = [float(p[0]) for p in points]
+        self.ys = [float(p[1]) for p in points]
+        self.alive = [True] * len(points)
+        self.alive_count = len(points)
+        self._build()
+
+    def _build(self) -> None:
+        """(Re)build the grid over the entries still alive."""
+        ids = [i for i in range(len(self.alive)) if self.alive[i]]
+        self.built_count = len(ids)
+        self.cells = {}
+        if not ids:
+            return
+        xs, ys = self.xs, self.ys
+        min_x = min(xs[i] for i in ids)
+        max_x = max(xs[i] for i in ids)
+        min_y = min(ys[i] for i in ids)
+        max_y = max(ys[i] for i in ids)
+        # about one entry per cell
+        area = max(max_x - min_x, 1.0) * max(max_y - min_y, 1.0)
+        self.cell = sqrt(area / len(ids))
+        for i in ids:
+            key = (floor(xs[i] / self.cell), floor(ys[i] / self.cell))
+            bucket = self.cells.get(key)
+            if bucket is None:
+                self.cells[key] = [i]
+            else:
+                bucket.append(i)
+        self.min_cx = floor(min_x / self.cell)
+        self.max_cx = floor(max_x / self.cell)
+        self.min_cy = floor(min_y / self.cell)
+        self.max_cy = floor(max_y / self.cell)
+
+    def remove(self, i: int) -> None:
+        """
+        Delete an entry from the index.
+
+        Args:
+            i (int): The identifier of the entry.
+        """
+        if not self.alive[i]:
+            return
+        self.alive[i] = False
+        self.alive_count -= 1
+        # Deleted entries are skipped lazily, the grid is compacted once most are gone
+        if 0 < self.alive_count < self.built_count // 4:
+            self._build()
+
+    def nearest(self, x: float, y: float):
+        """
+        Find the closest entry still alive.
+
+        Args:
+            x (float): The x coordinate of the query point.
+            y (float): The y coordinate of the query point.
+
+        Returns:
+            int: The identifier of the closest entry, or None if the index is empty.
+        """
+        if self.alive_count == 0:
+            return None
+        xs, ys, alive, cells = self.xs, self.ys, self.alive, self.cells
+        cell = self.cell
+        cx, cy = floor(x / cell), floor(y / cell)
+        max_r = max(
+            abs(cx - self.min_cx),
+            abs(cx - self.max_cx),
+            abs(cy - self.min_cy),
+            abs(cy - self.max_cy),
+        )
+        best, best_d = None, None
+        r = 0
+        while r <= max_r:
+            # Every cell of the ring r is at least (r - 1) cells away
+            if best is not None and ((r - 1) * cell) ** 2 > best_d:
+                break
+            for key in self._ring(cx, cy, r):
+                bucket = cells.get(key)
+                if bucket is None:
+                    continue
+                for i in bucket:
+                    if not alive[i]:
+                        continue
+                    d = (xs[i] - x) ** 2 + (ys[i] - y) ** 2
+                    if best is None or d < best_d or (d == best_d and i < best):
+                        best, best_d = i, d
+            r += 1
+        return best
+
+    def _ring(self, cx: int, cy: int, r: int):
+        """Yield the keys of the cells at Chebyshev distance r, clipped to the grid."""
+        if r == 0:
+            yield (cx, cy)
+            return
+        x0, x1 = max(cx - r, self.min_cx), min(cx + r, self.max_cx)
+        y0, y1 = max(cy - r + 1, self.min_cy), min(cy + r - 1, self.max_cy)
+        for gy in (cy - r, cy + r):
+            if self.min_cy <= gy <= self.max_cy:
+                for gx in range(x0, x1 + 1):
+                    yield (gx, gy)
+        for gx in (cx - r, cx + r):
+            if self.min_cx <= gx <= self.max_cx:
+                for gy in range(y0, y1 + 1):
+                    yield (gx, gy)
+
+
+def greedy_order(starts: list, ends: list, loops: list = None) -> tuple:
+    """
+    Compute the greedy nearest-neighbour sequence of strokes given by their endpoints.
+
+    Args:
+        starts (list): The (x, y) first point of every stroke.
+        ends (list): The (x, y) last point of every stroke.
+        loops (list): For every stroke, None or, if it is a closed loop that can start
+            from any of its vertices, the list of its (x, y) vertices without the
+            closing point.
+
+    Returns:
+        tuple: The indices of the strokes in drawing order, for each of them True if
+        it has to be drawn reversed, and the vertex it starts from if it is a loop.
+    """
+    if loops is None:
+        loops = [None] * len(starts)
+    # An open stroke is entered by its start (not flipped) or its end (flipped),
+    # a loop by any of its vertices, where the pen also leaves it
+    entries, flipped, vertex = [], [], []
+    first_entry = []
+    for start, end, loop in zip(starts, ends, loops):
+        first_entry.append(len(entries))
+        if loop is None:
+            entries += [start, end]
+            flipped += [False, True]
+            vertex += [0, 0]
+        else:
+            entries += loop
+            flipped += [False] * len(loop)
+            vertex += range(len(loop))
+    first_entry.append(len(entries))
+    stroke_of = [
+        k for k in range(len(starts)) for _ in range(first_entry[k], first_entry[k + 1])
+    ]
+    index = EntryIndex(entries)
+
+    for entry in range(first_entry[0], first_entry[1]):
+        index.remove(entry)
+    order, flips, rotations = [0], [False], [0]
+    x, y = ends[0]
+    for _ in range(1, len(starts)):
+        entry = index.nearest(x, y)
+        k = stroke_of[entry]
+        for other in range(first_entry[k], first_entry[k + 1]):
+            index.remove(other)
+        order.append(k)
+        flips.append(flipped[entry])
+        rotations.append(vertex[entry])
+        if loops[k] is not None:
+            x, y = entries[entry]
+        else:
+            x, y = starts[k] if flipped[entry] else ends[k]
+    return order, flips, rotations
+
+
+def order_strokes(
+    lines, verbose: bool = False, rotate_loops: bool = True, stats: dict = None
+):
+    """
+    Order strokes greedily so that each one starts as close as possible to the end of
+    the previous one, reversing strokes when that is shorter.
+
+    The first stroke is kept in place. Each remaining stroke is entered either by its
+    first point or by its last point (in which case it is reversed). Closed strokes,
+    whose last point repeats the first one, are entered by their nearest vertex and
+    drawn around from there, the direction makes no difference to the pen-up travel.
+
+    Args:
+        lines (list | Strokes): A list of lines, where each line is a list of (x, y)
+            coordinates, or Strokes.
+        verbose (bool): If True, print progress messages.
+        rotate_loops (bool): If False, closed strokes always start from their first point.
+        stats (dict): If given, receives the pen-up travel of the result in "travel" and
+            the travel saved by rotating the loops in "travel_saved", in the units of
+            the coordinates.
+
+    Returns:
+        list | Strokes: The sorted lines, in the same format as the input.
+    """
+    if verbose:
+        print("optimizing stroke sequence...")
+    if len(lines) == 0:
+        return lines if isinstance(lines, Strokes) else []
+
+    if isinstance(lines, Strokes):
+        starts, ends = lines.starts.tolist(), lines.ends.tolist()
+    else:
+        starts = [line[0] for line in lines]
+        ends = [line[-1] for line in lines]
+    loops = None
+    if rotate_loops:
+        loops = [
+            list(line[:-1]) if len(line) >= 3 and tuple(start) == tuple(end) else None
+            for line, start, end in zip(lines, starts, ends)
+        ]
+
+    order, flips, rotations = greedy_order(starts, ends, loops)
+    if isinstance(lines, Strokes):
+        result = lines.take(order, flips, rotations)
+    else:
+        result = []
+        for k, flip, r in zip(order, flips, rotations):
+            if r:
+                result.append(list(lines[k][r:]) + list(lines[k][1 : r + 1]))
+            else:
+                result.append(list(lines[k][::-1]) if flip else list(lines[k]))
+
+    if stats is not None:
+        travel = Strokes.from_lists(result).travel()
+        plain = Strokes.from_lists(lines).take(*greedy_order(starts, ends)[:2])
+        stats["travel"] = travel
+        stats["travel_saved"] = plain.travel() - travel
+    return result
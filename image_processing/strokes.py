@@ -0,0 +1,225 @@
+"""
+Compact storage for a drawing made of strokes.
+
+All the points live in one flat float32 (N, 2) array and the strokes are described by
+an offsets array: stroke i is points[offsets[i]:offsets[i + 1]].
+"""
+
+from itertools import chain
+from numpy import (
+    arange,
+    asarray,
+    concatenate,
+    cumsum,
+    diff,
+    float32,
+    fromiter,
+    int64,
+    maximum,
+    ndarray,
+    repeat,
+    sqrt,
+    where,
+    zeros,
+)
+
+
+class Strokes:
+    """
+    A list of strokes backed by a flat point array.
+
+    Indexing with an integer gives a view of the points of one stroke, slicing gives
+    Strokes sharing the same point array, and iterating yields the stroke views in order.
+    """
+
+    __slots__ = ["points", "offsets"]
+
+    def __init__(self, points: ndarray, offsets: ndarray):
+        """
+        Args:
+            points (ndarray): The (N, 2) array of all the points.
+            offsets (ndarray): The M + 1 start offsets of the M strokes, from 0 to N.
+        """
+        self.points = points
+        self.offsets = offsets
+
+    @staticmethod
+    def empty() -> "Strokes":
+        """Return a container without any stroke."""
+        return Strokes(zeros((0, 2), float32), zeros(1, int64))
+
+    @staticmethod
+    def from_lists(lines: list) -> "Strokes":
+        """
+        Build strokes from the list format used by the pipelines.
+
+        Args:
+            lines (list): A list of lines, where each line is a list of (x, y) coordinates.
+
+        Returns:
+            Strokes: The same strokes.
+        """
+        if isinstance(lines, Strokes):
+            return lines
+        lengths = fromiter((len(line) for line in lines), int64, len(lines))
+        offsets = concatenate(([0], cumsum(lengths))).astype(int64)
+        flat = fromiter(
+            chain.from_iterable(chain.from_iterable(lines)),
+            float32,
+            2 * int(offsets[-1]),
+        )
+        return Strokes(flat.reshape(-1, 2), offsets)
+
+    @staticmethod
+    def from_arrays(arrays: list) -> "Strokes":
+        """
+        Build strokes from a list of point arrays, like the contours of OpenCV.
+
+        Args:
+            arrays (list): A list of arrays holding 2 coordinates per point, of any shape.
+
+        Returns:
+            Strokes: The same strokes.
+        """
+        arrays = [asarray(a, float32).reshape(-1, 2) for a in arrays]
+        if len(arrays) == 0:
+            return Strokes.empty()
+        lengths = [len(a) for a in arrays]
+        offsets = concatenate(([0], cumsum(lengths))).astype(int64)
+        return Strokes(concatenate(arrays), offsets)
+
+    @staticmethod
+    def concat(parts: list) -> "Strokes":
+        """
+        Join several containers into one, with a single copy of the points.
+
+        Args:
+            parts (list): A list of Strokes.
+
+        Returns:
+            Strokes: The strokes of all the parts, in order.
+        """
+        parts = [part for part in parts if len(part) > 0]
+        if len(parts) == 0:
+            return Strokes.empty()
+        if len(parts) == 1:
+            return parts[0]
+        shifts = cumsum([0] + [part.num_points for part in parts[:-1]])
+        offsets = concatenate(
+            [parts[0].offsets[:1]]
+            + [part.offsets[1:] + shift for part, shift in zip(parts, shifts)]
+        )
+        return Strokes(concatenate([part.points for part in parts]), offsets)
+
+    def to_lists(self) -> list:
+        """
+        Convert to the list format used by the pipelines.
+
+        Returns:
+            list: A list of lines, where each line is a list of (x, y) tuples.
+        """
+        points = list(map(tuple, self.points.tolist()))
+        offsets = self.offsets.tolist()
+        return [points[offsets[i] : offsets[i + 1]] for i in range(len(self))]
+
+    @property
+    def num_points(self) -> int:
+        """The total number of points."""
+        return int(self.offsets[-1])
+
+    @property
+    def lengths(self) -> ndarray:
+        """The number of points of every stroke."""
+        return diff(self.offsets)
+
+    @property
+    def starts(self) -> ndarray:
+        """The first point of every stroke, as an (M, 2) array."""
+        return self.points[self.offsets[:-1]]
+
+    @property
+    def ends(self) -> ndarray:
+        """The last point of every stroke, as an (M, 2) array."""
+        return self.points[self.offsets[1:] - 1]
+
+    def stroke_index(self) -> ndarray:
+        """Return the index of the stroke of every point."""
+        return repeat(arange(len(self)), self.lengths)
+
+    def stroke(self, i: int, reverse: bool = False) -> ndarray:
+        """
+        Return a view of the points of one stroke.
+
+        Args:
+            i (int): The index of the stroke.
+            reverse (bool): If True, the points are seen from the last one to the first one.
+
+        Returns:
+            ndarray: The (n, 2) view.
+        """
+        view = self.points[self.offsets[i] : self.offsets[i + 1]]
+        return view[::-1] if reverse else view
+
+    def reversed(self) -> "Strokes":
+        """Return a view where the order of the strokes and of their points is reversed."""
+        return Strokes(self.points[::-1], self.offsets[-1] - self.offsets[::-1])
+
+    def take(self, order, reverse=None, rotate=None) -> "Strokes":
+        """
+        Gather strokes in a new order, with one copy of the points.
+
+        Args:
+            order (array-like): The indices of the strokes to keep, in their new order.
+            reverse (array-like): For every index of order, True to reverse the stroke.
+            rotate (array-like): For every index of order, the vertex a closed stroke
+                (whose last point repeats the first one) starts from, 0 to keep it.
+
+        Returns:
+            Strokes: The reordered strokes.
+        """
+        order = asarray(order, int64)
+        lengths = self.lengths[order]
+        offsets = concatenate(([0], cumsum(lengths))).astype(int64)
+        # position of every output point inside its stroke
+        k = arange(offsets[-1]) - repeat(offsets[:-1], lengths)
+        if reverse is not None:
+            reverse = asarray(reverse, bool)
+            k = where(repeat(reverse, lengths), repeat(lengths, lengths) - 1 - k, k)
+        if rotate is not None:
+            # The closing point is dropped and added back after the new first vertex
+            shift = repeat(asarray(rotate, int64), lengths)
+            loop = repeat(maximum(lengths - 1, 1), lengths)
+            k = where(shift > 0, (k + shift) % loop, k)
+        return Strokes(self.points[repeat(self.offsets[order], lengths) + k], offsets)
+
+    def travel(self) -> float:
+        """Return the pen-up distance from the end of each stroke to the start of the next."""
+        if len(self) < 2:
+            return 0.0
+        gaps = self.starts[1:].astype(float) - self.ends[:-1]
+        return float(sqrt((gaps**2).sum(axis=1)).sum())
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return self.take(range(start, stop, step))
+            stop = max(start, stop)
+            offsets = self.offsets[start : stop + 1]
+            return Strokes(self.points[offsets[0] : offsets[-1]], offsets - offsets[0])
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("stroke index out of range")
+        return self.points[self.offsets[i] : self.offsets[i + 1]]
+
+    def __iter__(self):
+        points, offsets = self.points, self.offsets.tolist()
+        for i in range(len(offsets) - 1):
+            yield points[offsets[i] : offsets[i + 1]]
+
+    def __repr__(self) -> str:
+        return f"Strokes({len(self)} strokes, {self.num_points} points)"
@@ -0,0 +1,36 @@
+"""
+Wall-time measurement of the stages of the image processing pipelines.
+"""
+
+from time import perf_counter
+
+
+class StageTimer:
+    """
+    Accumulate the time spent in each stage of a pipeline into a stats dict.
+
+    Each call to lap() charges the time elapsed since the previous lap (or since the
+    timer was created) to the given stage, in stats["timings"]. Without a stats dict
+    nothing is recorded, so pipelines can always create one.
+    """
+
+    def __init__(self, stats: dict = None):
+        """
+        Args:
+            stats (dict): The dict receiving the timings, in seconds.
+        """
+        self.timings = stats.setdefault("timings", {}) if stats is not None else None
+        self.last = perf_counter()
+
+    def lap(self, stage: str) -> None:
+        """
+        Close the current stage.
+
+        Args:
+            stage (str): The name of the stage.
+        """
+        if self.timings is None:
+            return
+        now = perf_counter()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - self.last
+        self.last = now
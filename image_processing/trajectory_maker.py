@@ -11,8 +11,10 @@ from cv2 import (
     findContours,
     CV_64F,
     COLOR_BGR2GRAY,
+    COLOR_RGB2BGR,
     CHAIN_APPROX_SIMPLE,
     contourArea,
+    arcLength,
     approxPolyDP,
     threshold,
     THRESH_BINARY,
@@ -20,24 +22,40 @@ from cv2 import (
     morphologyEx,
     MORPH_CLOSE,
     RETR_TREE,
-    imdecode,
-    IMREAD_COLOR,
 )
 from numpy import (
     transpose,
     ndarray,
     uint8,
     ones,
-    frombuffer,
+    add,
+    arange,
+    array,
+    float64,
+    floor,
+    hypot,
+    where,
 )
 from imutils import grab_contours
 from math import dist
 from shapely.geometry import Polygon
 
 try:
-    from image_processing.A4_calibration import fit_to_a4
+    from image_processing.A4_calibration import fit_to_a4_array, merge_pen_lifts
 except:
-    from A4_calibration import fit_to_a4
+    from A4_calibration import fit_to_a4_array, merge_pen_lifts
+try:
+    from image_processing.stroke_order import order_strokes
+except:
+    from stroke_order import order_strokes
+try:
+    from image_processing.strokes import Strokes
+except:
+    from strokes import Strokes
+try:
+    from image_processing.simplify import simplify_to_budget
+except:
+    from simplify import simplify_to_budget
 
 def calculate_area_perimeter_center(coords):
     polygon = Polygon(coords)
@@ -59,11 +77,141 @@ def compare_shapes(coords1, coords2, area_tolerance=0.1, perimeter_tolerance=0.1
     else:
         return False
 
-def trajectory_computation(
-    image: ndarray, epsilon=2, method="bluredcanny", show=False
-):
+def shape_descriptors(strokes):
+    """
+    Compute the area + 1, the perimeter and the centroid of every closed contour at once.
+
+    Gives the same values as calculate_area_perimeter_center, without building a
+    Polygon per contour.
+
+    Args:
+        strokes (Strokes): The contours, without their closing point.
+
+    Returns:
+        tuple: The areas, the perimeters and the (M, 2) centroids, as arrays.
+    """
+    n = strokes.num_points
+    if len(strokes) == 0:
+        return array([]), array([]), array([]).reshape(0, 2)
+    starts = strokes.offsets[:-1]
+    x, y = strokes.points.astype(float64).T
+    # index of the next point of the ring
+    following = arange(1, n + 1)
+    following[strokes.offsets[1:] - 1] = starts
+    xn, yn = x[following], y[following]
+
+    cross = x * yn - xn * y
+    signed_area = add.reduceat(cross, starts) / 2
+    segments = hypot(xn - x, yn - y)
+    perimeter = add.reduceat(segments, starts)
+
+    # Centroid of the surface, or of the outline if it is flat, or of the points
+    flat = signed_area == 0
+    surface = where(flat, 1, 6 * signed_area)
+    centroid = array(
+        [add.reduceat((x + xn) * cross, starts), add.reduceat((y + yn) * cross, starts)]
+    ).T / surface[:, None]
+    if flat.any():
+        outline = array(
+            [
+                add.reduceat(segments * (x + xn), starts),
+                add.reduceat(segments * (y + yn), starts),
+            ]
+        ).T / where(perimeter == 0, 1, 2 * perimeter)[:, None]
+        mean = array([add.reduceat(x, starts), add.reduceat(y, starts)]).T / (
+            strokes.lengths[:, None]
+        )
+        fallback = where((perimeter == 0)[:, None], mean, outline)
+        centroid = where(flat[:, None], fallback, centroid)
+    return abs(signed_area) + 1, perimeter, centroid
+
+def deduplicate_contours(strokes, area_tolerance=0.1, perimeter_tolerance=0.1, distance_tolerance=10):
+    """
+    Select the contours that do not look like a contour selected before them.
+
+    Same rule as calling compare_shapes against every kept contour, but the
+    descriptors are computed once and the candidates are looked up in a grid of
+    centroids with cells of distance_tolerance.
+
+    Args:
+        strokes (Strokes): The contours in their drawing order, without their closing point.
+
+    Returns:
+        list: The indices of the kept contours.
+    """
+    areas, perimeters, centroids = shape_descriptors(strokes)
+    areas, perimeters = areas.tolist(), perimeters.tolist()
+    cells = floor(centroids / distance_tolerance).astype(int).tolist()
+    centroids = centroids.tolist()
+    lengths = strokes.lengths.tolist()
+
+    kept = []
+    grid = {}
+    for i in range(len(strokes)):
+        if kept and lengths[i] < 4:
+            continue
+        cx, cy = cells[i]
+        duplicate = False
+        for neighbour in ((cx + a, cy + b) for a in (-1, 0, 1) for b in (-1, 0, 1)):
+            for j in grid.get(neighbour, ()):
+                if (
+                    abs(areas[i] - areas[j]) / max(areas[i], areas[j]) <= area_tolerance
+                    and abs(perimeters[i] - perimeters[j]) / max(perimeters[i], perimeters[j]) <= perimeter_tolerance
+                    and dist(centroids[i], centroids[j]) <= distance_tolerance
+                ):
+                    duplicate = True
+                    break
+            if duplicate:
+                break
+        if not duplicate:
+            kept.append(i)
+            grid.setdefault((cx, cy), []).append(i)
+    return kept
+
+def prune_twin_contours(contours, hierarchy, twin_width=2):
+    """
+    Remove the inner edge of the thin rings found by findContours with RETR_TREE.
+
+    A closed line gives an outer contour and a hole just inside it. The hole is
+    dropped when it is the only child of an outer contour and the ring between
+    them is at most twin_width pixels wide on average, the outer contour is kept.
+
+    Args:
+        contours (list): The contours found by findContours.
+        hierarchy (ndarray): Their hierarchy, as returned by findContours.
+        twin_width (float): The widest ring, in pixels, whose hole is dropped.
 
-    # Put the image in greyscale if it's not the case
+    Returns:
+        list: The remaining contours, in their original order.
+    """
+    if hierarchy is None or len(contours) == 0:
+        return list(contours)
+    links = hierarchy.reshape(-1, 4).tolist()
+
+    # Depth of every contour in the tree, outer contours are even and holes odd
+    depth = [-1] * len(links)
+    for i in range(len(links)):
+        path = []
+        j = i
+        while j >= 0 and depth[j] < 0:
+            path.append(j)
+            j = links[j][3]
+        d = depth[j] if j >= 0 else -1
+        for j in reversed(path):
+            d += 1
+            depth[j] = d
+
+    keep = [True] * len(contours)
+    for i, (following, previous, _, parent) in enumerate(links):
+        if parent < 0 or depth[parent] % 2 == 1 or following >= 0 or previous >= 0:
+            continue
+        ring = contourArea(contours[parent]) - contourArea(contours[i])
+        if ring <= twin_width * arcLength(contours[parent], True):
+            keep[i] = False
+    return [contour for contour, k in zip(contours, keep) if k]
+
+def to_grayscale(image: ndarray) -> ndarray:
+    """Put the image in greyscale if it's not the case, in landscape orientation."""
     try:
         if len(image.shape) == 2:
             image = convertScaleAbs(image)
@@ -79,15 +227,17 @@ def trajectory_computation(
         
     if image.shape[0] > image.shape[1]:
         image = transpose(image.copy())
-        
-    # processes the image using the chosen algorithm
-    imgBlur = GaussianBlur(image,(3,3),0)
+    return image
+
+def detect_edges(image: ndarray, method="bluredcanny") -> ndarray:
+    """Processes the greyscale image using the chosen algorithm."""
     if method == "bluredcanny":
         imgBlur = GaussianBlur(image, (3, 3), 0)
         chosen = Canny(imgBlur, 50, 150)
     elif method == "laplacian":
         imgBlur = GaussianBlur(image, (3, 3), 0)
-        chosen = Laplacian(imgBlur, CV_64F, ksize=3, scale=1)
+        edge = convertScaleAbs(Laplacian(imgBlur, CV_64F, ksize=3, scale=1))
+        _, chosen = threshold(edge, 128, 255, THRESH_BINARY | THRESH_OTSU)
     elif method == "sobel":
         x = Sobel(image, CV_64F, 1, 0, ksize=3, scale=1)
         y = Sobel(image, CV_64F, 0, 1, ksize=3, scale=1)
@@ -98,79 +248,96 @@ def trajectory_computation(
 
     else:
         chosen = Canny(image, 50, 150)
+    return chosen
 
-    # Close the image
-    r = 5
+def close_edges(edges: ndarray, r=5) -> ndarray:
+    """Close the gaps of the edges with a square of r pixels."""
     kernel = ones((r, r), uint8)
-    chosen = morphologyEx(chosen, MORPH_CLOSE, kernel)
+    return morphologyEx(edges, MORPH_CLOSE, kernel)
 
-    # Find contours
-    contours = findContours(
-        chosen, mode=RETR_TREE, method=CHAIN_APPROX_SIMPLE
+def find_contours(closed: ndarray, prune_twins=True) -> list:
+    """Find the contours, from the biggest to the smallest, and drop the inner edge
+    of every closed line."""
+    found = findContours(
+        closed, mode=RETR_TREE, method=CHAIN_APPROX_SIMPLE
     )
     
-    contours = grab_contours(contours)
-    contours = sorted(contours, key = contourArea, reverse = True)
+    contours = grab_contours(found)
+    if prune_twins:
+        contours = prune_twin_contours(contours, found[-1])
+    return sorted(contours, key = contourArea, reverse = True)
 
-    # Calculate the center of the image
-    height, width = chosen.shape
+def approximate_contours(contours, epsilon, shape) -> Strokes:
+    """Approximate the contours with polygons, centered on an image of the given shape
+    with the y axis up."""
+    height, width = shape[:2]
     center_x, center_y = width // 2, height // 2
 
-    # Process each contour and normalize the coordinates
-    contours_approx = []
-    for contour in contours:
-    # Approximation des contours en polygones avec une précision de 2%
-        approx = approxPolyDP(contour, epsilon, True)
-        
-        # Convertir chaque contour approximé en une liste de tuples de points
-        contour_points = [(point[0][0] - center_x, - point[0][1] + center_y) for point in approx]
-        
-        # Ajouter le contour approximé à la liste si il ne ressemble pas à un présent
-        flag = True
-        if len(contours_approx) != 0:
-            for line in contours_approx:
-                if len(contour_points) < 4 or compare_shapes(line, contour_points):
-                    flag = False
-                    break
-        if flag:
-            contour_points.append(contour_points[0])
-            contours_approx.append(contour_points)
-
-        
-        
+    approxes = Strokes.from_arrays(
+        [approxPolyDP(contour, epsilon, True) for contour in contours]
+    )
+    approxes.points[:] = approxes.points * (1, -1) + (-center_x, center_y)
+    return approxes
 
-    # Plot the contours for preview
-    import matplotlib
-    matplotlib.use("Agg")
-    from matplotlib import pyplot as plt
-    from io import BytesIO
+def select_contours(approxes: Strokes) -> Strokes:
+    """Keep the polygons that do not look like one already kept, closed."""
+    contours_approx = []
+    for i in deduplicate_contours(approxes):
+        contour_points = list(map(tuple, approxes[i].astype(int).tolist()))
+        contour_points.append(contour_points[0])
+        contours_approx.append(contour_points)
+    return Strokes.from_lists(contours_approx)
 
-    fig, ax = plt.subplots(figsize=(10, 8))
+def arrange_strokes(strokes: Strokes, order="area", max_points=None, stats=None) -> Strokes:
+    """Fit the waypoint budget, then draw the contours from the biggest to the smallest
+    or chain them by proximity."""
+    if max_points is not None:
+        strokes = simplify_to_budget(strokes, max_points)
+    if order == "nearest":
+        strokes = order_strokes(strokes, stats=stats)
+    return strokes
 
-    # Plot each line
-    for i,line in enumerate(contours_approx):
-        x_coords, y_coords = zip(*line)
-        ax.plot(x_coords, y_coords)
-        
+def fit_strokes(strokes: Strokes, lift_tolerance_mm=0.5, stats=None) -> ndarray:
+    """Fit the trajectories to an A4 paper, drawing the small gaps between strokes
+    instead of lifting the pen."""
+    points, stroke_index = fit_to_a4_array(strokes)
+    points, _, lifts_removed = merge_pen_lifts(points, stroke_index, lift_tolerance_mm)
+    if stats is not None:
+        stats["lifts_removed"] = lifts_removed
+    return points
 
-    # Set the aspect of the plot to be equal, so the drawing isn't distorted
-    ax.set_aspect("equal")
-    ax.axis("off")
+def trajectory_computation(
+    image: ndarray,
+    epsilon=2,
+    method="bluredcanny",
+    show=False,
+    order="area",
+    preview_size=(640, 480),
+    stats=None,
+    prune_twins=True,
+    max_points=None,
+    lift_tolerance_mm=0.5,
+    report_travel=False,
+):
+    # The stages are only listed in TrajectoryPipeline, run here once without reuse
+    try:
+        from image_processing.pipeline import TrajectoryPipeline
+    except:
+        from pipeline import TrajectoryPipeline
 
+    points, nb_points, nb_contours, preview = TrajectoryPipeline().run(
+        image,
+        epsilon,
+        method,
+        order,
+        preview_size,
+        prune_twins=prune_twins,
+        max_points=max_points,
+        lift_tolerance_mm=lift_tolerance_mm,
+        report_travel=report_travel,
+        stats=stats,
+    )
     if show:
-        plt.show()
-    # Save the plot as an image in a variable
-    buffer = BytesIO()
-    plt.savefig(buffer, format="png", bbox_inches="tight", pad_inches=0)
-    buffer.seek(0)
-    image_buffer = buffer.getvalue()
-    # Close the plot to free up memory
-    plt.close(fig)
-    np_image = frombuffer(image_buffer, dtype=uint8)
-    preview = imdecode(np_image, IMREAD_COLOR)
-
-    # Fit the trajectories to an A4 paper
-    points = fit_to_a4(contours_approx)
-    nbPoints = len(points)
-    nbContours = len(contours_approx)
-    return points, nbPoints, nbContours, preview
+        imshow("Preview", cvtColor(preview, COLOR_RGB2BGR))
+        waitKey()
+    return points, nb_points, nb_contours, preview
@@ -24,6 +24,9 @@ class Control():
         # return setp
 
     def sendCoordonates(self, coordonates: list[list[float]]) -> None:
+        # The pipelines give an (N, 6) array, the connector sends lists
+        if hasattr(coordonates, "tolist"):
+            coordonates = coordonates.tolist()
         monitor = RTDEConnect(self.ROBOT_HOST, self.config_filename)
         print("The robot is connected")
         keep_running = True
@@ -53,7 +56,9 @@ class Control():
                     index += 1
                 else:
                     new_coordonates = coordonates[0]
-                monitor.sendall("setp", new_coordonates)
+                # the setpoint and the watchdog kick leave in one write
+                monitor.send_many([("setp", new_coordonates), ("watchdog", 0)])
+                continue
             elif state.output_int_register_0 == 0:
                 ready2Next = True
 
@@ -22,4 +22,5 @@
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 from .rtde import *
+from .rtde_async import *
 from .rtde_config import *
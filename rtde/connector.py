@@ -119,10 +119,10 @@ class RTDEConnect:
         the field parameter. Can be a single value in the case of sending a single field.
         """
         if type(field) is not list:
-            self.inputDict[key].__dict__[field] = value
+            setattr(self.inputDict[key], field, value)
         else:
             for i in range(len(field)):
-                self.inputDict[key].__dict__[field[i]] = value[i]
+                setattr(self.inputDict[key], field[i], value[i])
         self.con.send(self.inputDict[key])
         # return self.con.send(cmd)
 
@@ -133,12 +133,26 @@ class RTDEConnect:
         :param str key: The key to pull the corresponding inputs from.
         :param value: A list of updated input values to send to RTDE.
         """
+        self._assign(key, value)
+        self.con.send(self.inputDict[key])
+
+    def send_many(self, items):
+        """
+        Send the inputs of several keys to the robot in a single write, e.g. a setpoint and the watchdog kick.
+        :param items: A list of (key, value) pairs, value being given like in sendall.
+        """
+        for key, value in items:
+            self._assign(key, value)
+        self.con.send_many([self.inputDict[key] for key, _ in items])
+
+    def _assign(self, key, value):
         if type(value) is not list:
-            self.inputDict[key].__dict__[self.inputKeys[key][0]] = value
+            setattr(self.inputDict[key], self.inputKeys[key][0], value)
+        elif len(value) == len(self.inputKeys[key]):
+            self.inputDict[key].assign(value)
         else:
             for i in range(len(value)):
-                self.inputDict[key].__dict__[self.inputKeys[key][i]] = value[i]
-        self.con.send(self.inputDict[key])
+                setattr(self.inputDict[key], self.inputKeys[key][i], value[i])
 
     def shutdown(self):
         """
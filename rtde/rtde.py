@@ -34,6 +34,11 @@ else:
   from rtde import serialize
 
 DEFAULT_TIMEOUT = 1.0
+RECEIVE_BUFFER_SIZE = 65536 # initial size of the receive buffer, grows if needed
+RECEIVE_CHUNK_SIZE = 4096   # free space kept at the end of the buffer for a recv
+SEND_BUFFER_SIZE = 1024     # initial size of the send buffer, grows if needed
+
+HEADER = struct.Struct('>HB') # size and command of every package
 
 LOGNAME = 'rtde'
 _log = logging.getLogger(LOGNAME)
@@ -78,12 +83,17 @@ class RTDE(object):
         self.__input_config = {}
         self.__skipped_package_count = 0
         self.__protocolVersion = RTDE_PROTOCOL_VERSION_1
+        self.__reset_buffer()
+        self.__send_buf = bytearray(SEND_BUFFER_SIZE)
+        self.__send_view = memoryview(self.__send_buf)
+        self.__writable = False
 
     def connect(self):
         if self.__sock:
             return
 
-        self.__buf = b'' # buffer data in binary format
+        self.__reset_buffer()
+        self.__writable = False
         try:
             self.__sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -137,7 +147,7 @@ class RTDE(object):
             return None
         result.names = variables
         self.__input_config[result.id] = result
-        return serialize.DataObject.create_empty(variables, result.id)
+        return result.record(result.id)
 
     def send_output_setup(self, variables, types=[], frequency=125):
         cmd = Command.RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS
@@ -174,14 +184,29 @@ class RTDE(object):
         return success
 
     def send(self, input_data):
+        return self.send_many((input_data,))
+
+    def send_many(self, inputs):
+        """Send several input packages in a single write.
+        The packages are packed one after the other in a reusable buffer,
+        e.g. a setpoint and the watchdog kick of the same cycle
+        """
         if self.__conn_state != ConnectionState.STARTED:
             _log.error('Cannot send when RTDE synchronization is inactive')
             return
-        if not input_data.recipe_id in self.__input_config:
-            _log.error('Input configuration id not found: ' + str(input_data.recipe_id))
-            return
-        config = self.__input_config[input_data.recipe_id]
-        return self.__sendall(Command.RTDE_DATA_PACKAGE, config.pack(input_data))
+        offset = 0
+        for input_data in inputs:
+            if not input_data.recipe_id in self.__input_config:
+                _log.error('Input configuration id not found: ' + str(input_data.recipe_id))
+                return
+            config = self.__input_config[input_data.recipe_id]
+            size = HEADER.size + config.codec.size
+            if offset + size > len(self.__send_buf):
+                self.__grow_send_buffer(offset + size)
+            HEADER.pack_into(self.__send_buf, offset, size, Command.RTDE_DATA_PACKAGE)
+            config.pack_into(self.__send_buf, offset + HEADER.size, input_data)
+            offset += size
+        return self.__write(self.__send_view[:offset])
 
 
     def receive(self, binary=False):
@@ -209,7 +234,7 @@ class RTDE(object):
 
         try:
             while self.is_connected() and \
-                  (buffer_limit == None or len(self.__buf) < buffer_limit) and \
+                  (buffer_limit == None or self.__end - self.__start < buffer_limit) and \
                   self.__recv_to_buffer(0):
                 pass
         except RTDEException as e:
@@ -228,6 +253,11 @@ class RTDE(object):
         return self.__sendall(cmd, payload)
 
     def __on_packet(self, cmd, payload):
+        if cmd == Command.RTDE_DATA_PACKAGE:
+            return self.__unpack_data_package(payload, self.__output_config)
+        # payload is a view of the receive buffer, the other packages are rare
+        # and their decoders expect bytes
+        payload = bytes(payload)
         if cmd == Command.RTDE_REQUEST_PROTOCOL_VERSION:
             return self.__unpack_protocol_version_package(payload)
         elif cmd == Command.RTDE_GET_URCONTROL_VERSION:
@@ -242,8 +272,6 @@ class RTDE(object):
             return self.__unpack_start_package(payload)
         elif cmd == Command.RTDE_CONTROL_PACKAGE_PAUSE:
             return self.__unpack_pause_package(payload)
-        elif cmd == Command.RTDE_DATA_PACKAGE:
-            return self.__unpack_data_package(payload, self.__output_config)
         else:
             _log.error('Unknown package command: ' + str(cmd))
 
@@ -257,18 +285,35 @@ class RTDE(object):
         fmt = '>HB'
         size = struct.calcsize(fmt) + len(payload)
         buf = struct.pack(fmt, size, command) + payload
+        return self.__write(buf)
 
+    def __write(self, buf):
         if self.__sock is None:
             _log.error('Unable to send: not connected to Robot')
             return False
 
-        _, writable, _ = select.select([], [self.__sock], [], DEFAULT_TIMEOUT)
-        if len(writable):
+        # Once a send went through, the socket timeout is enough to detect a
+        # controller that stopped reading, select is only needed before that
+        if not self.__writable:
+            _, writable, _ = select.select([], [self.__sock], [], DEFAULT_TIMEOUT)
+            if not len(writable):
+                self.__trigger_disconnected()
+                return False
+        try:
             self.__sock.sendall(buf)
-            return True
-        else:
+        except socket.timeout:
+            self.__writable = False
             self.__trigger_disconnected()
             return False
+        self.__writable = True
+        return True
+
+    def __grow_send_buffer(self, size):
+        # Keep the packages already packed
+        buf = bytearray(max(2 * len(self.__send_buf), size))
+        buf[:len(self.__send_buf)] = self.__send_buf
+        self.__send_buf = buf
+        self.__send_view = memoryview(buf)
 
     def has_data(self):
         timeout = 0
@@ -282,42 +327,39 @@ class RTDE(object):
             except RTDETimeoutException:
                 return None
 
-            # unpack_from requires a buffer of at least 3 bytes
-            while len(self.__buf) >= 3:
-                # Attempts to extract a packet
-                packet_header = serialize.ControlHeader.unpack(self.__buf)
-
-                if len(self.__buf) >= packet_header.size:
-                    packet, self.__buf = self.__buf[3:packet_header.size], self.__buf[packet_header.size:]
-                    data = self.__on_packet(packet_header.command, packet)
-                    if len(self.__buf) >= 3 and command == Command.RTDE_DATA_PACKAGE:
-                        next_packet_header = serialize.ControlHeader.unpack(self.__buf)
-                        if next_packet_header.command == command:
-                            _log.debug('skipping package(1)')
-                            self.__skipped_package_count += 1
-                            continue
-                    if packet_header.command == command:
-                        if(binary):
-                            return packet[1:]
-
-                        return data
-                    else:
-                        _log.debug('skipping package(2)')
-                else:
+            # Attempts to extract the packets
+            while True:
+                if command == Command.RTDE_DATA_PACKAGE:
+                    self.__skip_stale_data_packages()
+                packet = self.__next_packet()
+                if packet is None:
                     break
+                packet_command, payload = packet
+                if packet_command == command:
+                    # Only the package returned is decoded
+                    if(binary):
+                        return bytes(payload[1:])
+
+                    return self.__on_packet(packet_command, payload)
+                else:
+                    # Still decoded, text messages are logged
+                    self.__on_packet(packet_command, payload)
+                    _log.debug('skipping package(2)')
         raise RTDEException(' _recv() Connection lost ')
 
     def __recv_to_buffer(self, timeout):
         readable, _, xlist = select.select([self.__sock], [], [self.__sock], timeout)
         if len(readable):
-            more = self.__sock.recv(4096)
+            if len(self.__buf) - self.__end < RECEIVE_CHUNK_SIZE:
+                self.__compact_buffer()
+            more = self.__sock.recv_into(self.__view[self.__end:])
             #When the controller stops while the script is running
-            if len(more) == 0:
+            if more == 0:
                 _log.error('received 0 bytes from Controller, probable cause: Controller has stopped')
                 self.__trigger_disconnected()  
                 raise RTDEException('received 0 bytes from Controller')
 
-            self.__buf = self.__buf + more
+            self.__end += more
             return True
 
         if (len(xlist) or len(readable) == 0) and timeout != 0: # Effectively a timeout of timeout seconds
@@ -328,23 +370,76 @@ class RTDE(object):
 
 
     def __recv_from_buffer(self, command, binary=False):
-        # unpack_from requires a buffer of at least 3 bytes
-        while len(self.__buf) >= 3:
-            # Attempts to extract a packet
-            packet_header = serialize.ControlHeader.unpack(self.__buf)
-
-            if len(self.__buf) >= packet_header.size:
-                packet, self.__buf = self.__buf[3:packet_header.size], self.__buf[packet_header.size:]
-                data = self.__on_packet(packet_header.command, packet)
-                if packet_header.command == command:
-                    if(binary):
-                        return packet[1:]
-
-                    return data
-                else:
-                    _log.debug('skipping package(2)')
+        # Attempts to extract a packet
+        packet = self.__next_packet()
+        while packet is not None:
+            packet_command, payload = packet
+            data = self.__on_packet(packet_command, payload)
+            if packet_command == command:
+                if(binary):
+                    return bytes(payload[1:])
+
+                return data
             else:
-                return None
+                _log.debug('skipping package(2)')
+            packet = self.__next_packet()
+        return None
+
+    def __reset_buffer(self):
+        # The packages are received in a preallocated buffer and read in place,
+        # the bytes between start and end are received but not parsed yet
+        self.__buf = bytearray(RECEIVE_BUFFER_SIZE)
+        self.__view = memoryview(self.__buf)
+        self.__start = 0
+        self.__end = 0
+
+    def __compact_buffer(self):
+        # Move the unparsed bytes to the beginning of the buffer to make room at
+        # the end, the buffer only grows for a package or a backlog bigger than it
+        pending = self.__end - self.__start
+        if pending + RECEIVE_CHUNK_SIZE > len(self.__buf):
+            buf = bytearray(max(2 * len(self.__buf), pending + RECEIVE_CHUNK_SIZE))
+            buf[:pending] = self.__view[self.__start:self.__end]
+            self.__buf = buf
+            self.__view = memoryview(buf)
+        else:
+            self.__buf[:pending] = self.__view[self.__start:self.__end]
+        self.__start = 0
+        self.__end = pending
+
+    def __skip_stale_data_packages(self):
+        # Jump over the data packages followed by the header of another data
+        # package, reading only their headers, so a client that fell behind
+        # decodes the newest package only
+        buf = self.__buf
+        start = self.__start
+        data = Command.RTDE_DATA_PACKAGE
+        while self.__end - start >= 3 and buf[start + 2] == data:
+            following = start + HEADER.unpack_from(buf, start)[0]
+            if self.__end - following < 3 or buf[following + 2] != data:
+                break
+            _log.debug('skipping package(1)')
+            self.__skipped_package_count += 1
+            start = following
+        self.__start = start
+
+    def __next_packet(self):
+        # Command and payload of the next complete package, None if it isn't received yet.
+        # The payload is a view of the buffer, valid until the next receive.
+        # unpack_from requires a buffer of at least 3 bytes
+        if self.__end - self.__start < 3:
+            return None
+        size, command = HEADER.unpack_from(self.__buf, self.__start)
+        end = self.__start + size
+        if end > self.__end:
+            return None
+        payload = self.__view[self.__start + 3:end]
+        if end == self.__end:
+            # Everything is parsed, the next recv can start at the beginning
+            self.__start = self.__end = 0
+        else:
+            self.__start = end
+        return command, payload
 
     def __trigger_disconnected(self):
         _log.info("RTDE disconnected")
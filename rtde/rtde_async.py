@@ -0,0 +1,309 @@
+import asyncio
+import collections
+import logging
+import os
+import socket
+import struct
+
+from rtde import serialize
+from rtde.rtde import (
+    Command,
+    ConnectionState,
+    DEFAULT_TIMEOUT,
+    HEADER,
+    RTDE_PROTOCOL_VERSION_1,
+    RTDE_PROTOCOL_VERSION_2,
+    RTDEException,
+)
+
+__all__ = ['AsyncRTDE']
+
+LOGNAME = 'rtde'
+_log = logging.getLogger(LOGNAME)
+
+
+class AsyncRTDE(object):
+    """RTDE client for asyncio, with the handshake of RTDE.
+
+    A single task reads the socket: the replies to the requests complete their
+    awaiting call, text messages are logged and data packages are queued. With
+    the default queue_size of 1 only the newest data package is kept, like
+    RTDE.receive, and the older ones are dropped without being decoded. With
+    queue_size None every package is kept, like RTDE.receive_buffered.
+
+        con = AsyncRTDE(host, port)
+        await con.connect()
+        await con.send_output_setup(names, types)
+        setp = await con.send_input_setup(setp_names, setp_types)
+        await con.send_start()
+        async for state in con:
+            setp.assign(next_pose)
+            await con.send(setp)
+    """
+
+    def __init__(self, hostname, port=os.getenv("PORT_RTDE"), queue_size=1):
+        self.hostname = hostname
+        self.port = port
+        self.__conn_state = ConnectionState.DISCONNECTED
+        self.__reader = None
+        self.__writer = None
+        self.__read_task = None
+        self.__output_config = None
+        self.__input_config = {}
+        self.__skipped_package_count = 0
+        self.__protocolVersion = RTDE_PROTOCOL_VERSION_1
+        self.__packages = collections.deque(maxlen=queue_size)
+        self.__package_ready = asyncio.Event()
+        self.__replies = {}
+        self.__request_lock = asyncio.Lock()
+
+    async def connect(self):
+        if self.__writer:
+            return
+
+        self.__skipped_package_count = 0
+        self.__packages.clear()
+        self.__reader, self.__writer = await asyncio.wait_for(
+            asyncio.open_connection(self.hostname, self.port), DEFAULT_TIMEOUT)
+        self.__writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.__conn_state = ConnectionState.CONNECTED
+        self.__read_task = asyncio.ensure_future(self.__read_loop())
+        try:
+            if not await self.negotiate_protocol_version():
+                raise RTDEException('Unable to negotiate protocol version')
+        except:
+            await self.disconnect()
+            raise
+
+    async def disconnect(self):
+        writer = self.__writer
+        if self.__read_task:
+            # Its clean-up runs before a new connection can start
+            self.__read_task.cancel()
+            await asyncio.wait((self.__read_task,))
+            self.__read_task = None
+        if writer:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+        self.__writer = None
+        self.__conn_state = ConnectionState.DISCONNECTED
+
+    def is_connected(self):
+        return self.__conn_state is not ConnectionState.DISCONNECTED
+
+    async def get_controller_version(self):
+        version = await self.__send_and_receive(Command.RTDE_GET_URCONTROL_VERSION)
+        if version:
+            _log.info('Controller version: ' + str(version.major) + '.' + str(version.minor) + '.' + str(version.bugfix)+ '.' + str(version.build))
+            if version.major == 3 and version.minor <= 2 and version.bugfix < 19171:
+                raise RTDEException('Please upgrade your controller to minimally version 3.2.19171')
+            return version.major, version.minor, version.bugfix, version.build
+        return None, None, None, None
+
+    async def negotiate_protocol_version(self):
+        payload = struct.pack('>H', RTDE_PROTOCOL_VERSION_2)
+        success = await self.__send_and_receive(Command.RTDE_REQUEST_PROTOCOL_VERSION, payload)
+        if success:
+            self.__protocolVersion = RTDE_PROTOCOL_VERSION_2
+        return success
+
+    async def send_input_setup(self, variables, types=[]):
+        payload = bytearray(','.join(variables), 'utf-8')
+        result = await self.__send_and_receive(Command.RTDE_CONTROL_PACKAGE_SETUP_INPUTS, payload)
+        if len(types)!=0 and result.types != list(types):
+            _log.error('Data type inconsistency for input setup: ' +
+                     str(types) + ' - ' +
+                     str(result.types))
+            return None
+        result.names = variables
+        self.__input_config[result.id] = result
+        return result.record(result.id)
+
+    async def send_output_setup(self, variables, types=[], frequency=125):
+        payload = struct.pack('>d', frequency)
+        payload = payload + (','.join(variables).encode('utf-8'))
+        result = await self.__send_and_receive(Command.RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS, payload)
+        if len(types)!=0 and result.types != list(types):
+            _log.error('Data type inconsistency for output setup: ' +
+                     str(types) + ' - ' +
+                     str(result.types))
+            return False
+        result.names = variables
+        self.__output_config = result
+        return True
+
+    async def send_start(self):
+        success = await self.__send_and_receive(Command.RTDE_CONTROL_PACKAGE_START)
+        success = success and self.__reading()
+        if success:
+            _log.info('RTDE synchronization started')
+            self.__conn_state = ConnectionState.STARTED
+        else:
+            _log.error('RTDE synchronization failed to start')
+        return success
+
+    async def send_pause(self):
+        success = await self.__send_and_receive(Command.RTDE_CONTROL_PACKAGE_PAUSE)
+        success = success and self.__reading()
+        if success:
+            _log.info('RTDE synchronization paused')
+            self.__conn_state = ConnectionState.PAUSED
+        else:
+            _log.error('RTDE synchronization failed to pause')
+        return success
+
+    async def send(self, input_data):
+        return await self.send_many((input_data,))
+
+    async def send_many(self, inputs):
+        """Send several input packages in a single write."""
+        if self.__conn_state != ConnectionState.STARTED:
+            _log.error('Cannot send when RTDE synchronization is inactive')
+            return
+        packages = []
+        for input_data in inputs:
+            if not input_data.recipe_id in self.__input_config:
+                _log.error('Input configuration id not found: ' + str(input_data.recipe_id))
+                return
+            config = self.__input_config[input_data.recipe_id]
+            packages.append(HEADER.pack(HEADER.size + config.codec.size, Command.RTDE_DATA_PACKAGE))
+            packages.append(config.pack(input_data))
+        return await self.__write(b''.join(packages))
+
+    async def receive(self, binary=False):
+        """Receive the next queued data package.
+        Waits until a package is received, raises RTDEException if the
+        connection is lost
+        """
+        if self.__output_config is None:
+            raise RTDEException('Output configuration not initialized')
+        while not self.__packages:
+            if self.__conn_state != ConnectionState.STARTED or not self.__reading():
+                raise RTDEException('Cannot receive when RTDE synchronization is inactive')
+            self.__package_ready.clear()
+            await self.__package_ready.wait()
+        payload = self.__packages.popleft()
+        if(binary):
+            return payload[1:]
+        return self.__output_config.unpack(payload)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.receive()
+        except RTDEException:
+            if self.is_connected() and self.__output_config is not None:
+                raise
+            raise StopAsyncIteration
+
+    async def __send_and_receive(self, cmd, payload=b''):
+        # One request at a time, the replies only carry their command
+        async with self.__request_lock:
+            reply = asyncio.get_running_loop().create_future()
+            self.__replies[cmd] = reply
+            try:
+                if not await self.__write(HEADER.pack(HEADER.size + len(payload), cmd) + payload):
+                    return None
+                payload = await asyncio.wait_for(reply, DEFAULT_TIMEOUT)
+            except asyncio.TimeoutError:
+                _log.warning('no reply received in last %d seconds ', DEFAULT_TIMEOUT)
+                return None
+            finally:
+                self.__replies.pop(cmd, None)
+        return self.__unpack_reply(cmd, payload)
+
+    async def __write(self, buf):
+        if self.__writer is None:
+            _log.error('Unable to send: not connected to Robot')
+            return False
+        try:
+            self.__writer.write(buf)
+            await asyncio.wait_for(self.__writer.drain(), DEFAULT_TIMEOUT)
+        except (asyncio.TimeoutError, ConnectionError):
+            await self.__trigger_disconnected()
+            return False
+        return True
+
+    def __reading(self):
+        # The read loop may have ended while a reply was on its way
+        return self.__read_task is not None and not self.__read_task.done()
+
+    async def __read_loop(self):
+        try:
+            while True:
+                size, command = HEADER.unpack(await self.__reader.readexactly(HEADER.size))
+                payload = await self.__reader.readexactly(size - HEADER.size)
+                if command == Command.RTDE_DATA_PACKAGE:
+                    # Decoded by receive, so the dropped ones never are
+                    if len(self.__packages) == self.__packages.maxlen:
+                        _log.debug('skipping package(1)')
+                        self.__skipped_package_count += 1
+                    self.__packages.append(payload)
+                    self.__package_ready.set()
+                elif command == Command.RTDE_TEXT_MESSAGE:
+                    self.__log_text_message(payload)
+                elif command in self.__replies and not self.__replies[command].done():
+                    self.__replies[command].set_result(payload)
+                else:
+                    _log.debug('skipping package(2)')
+        except (asyncio.IncompleteReadError, ConnectionError):
+            _log.error('received 0 bytes from Controller, probable cause: Controller has stopped')
+        finally:
+            self.__conn_state = ConnectionState.DISCONNECTED
+            # Like RTDE.__trigger_disconnected, so that connect starts over
+            if self.__writer:
+                self.__writer.close()
+                self.__writer = None
+            for reply in self.__replies.values():
+                if not reply.done():
+                    reply.set_exception(RTDEException('Connection lost'))
+            # Wake up receive so it sees the disconnection
+            self.__package_ready.set()
+
+    async def __trigger_disconnected(self):
+        _log.info("RTDE disconnected")
+        await self.disconnect() #clean-up
+
+    def __unpack_reply(self, cmd, payload):
+        if cmd == Command.RTDE_GET_URCONTROL_VERSION:
+            if len(payload) != 16:
+                _log.error('RTDE_GET_URCONTROL_VERSION: Wrong payload size')
+                return None
+            return serialize.ControlVersion.unpack(payload)
+        if cmd in (Command.RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS, Command.RTDE_CONTROL_PACKAGE_SETUP_INPUTS):
+            if len(payload) < 1:
+                _log.error('RTDE setup: No payload')
+                return None
+            return serialize.DataConfig.unpack_recipe(payload)
+        # protocol version, start and pause
+        if len(payload) != 1:
+            _log.error('Wrong payload size for command ' + str(cmd))
+            return None
+        return serialize.ReturnValue.unpack(payload).success
+
+    def __log_text_message(self, payload):
+        if len(payload) < 1:
+            _log.error('RTDE_TEXT_MESSAGE: No payload')
+            return
+        if(self.__protocolVersion == RTDE_PROTOCOL_VERSION_1):
+            msg = serialize.MessageV1.unpack(payload)
+        else:
+            msg = serialize.Message.unpack(payload)
+
+        if(msg.level == serialize.Message.EXCEPTION_MESSAGE or
+           msg.level == serialize.Message.ERROR_MESSAGE):
+            _log.error(msg.source + ': ' + msg.message)
+        elif msg.level == serialize.Message.WARNING_MESSAGE:
+            _log.warning(msg.source + ': ' + msg.message)
+        elif msg.level == serialize.Message.INFO_MESSAGE:
+            _log.info(msg.source + ': ' + msg.message)
+
+    @property
+    def skipped_package_count(self):
+        """The skipped package count, resets on connect"""
+        return self.__skipped_package_count
@@ -21,6 +21,7 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 # SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import keyword
 import struct
 
 
@@ -120,6 +121,79 @@ def unpack_field(data, offset, data_type):
     raise ValueError('unpack_field: unknown data type: ' + data_type)
 
 
+def _uninitialized(record):
+    for name in record.__slots__[1:]: # after the recipe id
+        if getattr(record, name) is None:
+            raise ValueError('Uninitialized parameter: ' + name)
+
+
+RECORD_TEMPLATE = '''
+class DataRecord(object):
+    __slots__ = {slots!r}
+
+    def __init__(self, recipe_id=None):
+        self.recipe_id = recipe_id
+{init}
+
+    @classmethod
+    def unpack(cls, data):
+        obj = _new(cls)
+        obj.recipe_id = data[0]
+{unpack}
+        return obj
+
+    def values(self):
+        if {checks}:
+            _uninitialized(self)
+        return (self.recipe_id, {values})
+
+    def assign(self, values):
+        {fields} = values
+'''
+
+RESERVED_NAMES = ('recipe_id', 'unpack', 'values', 'assign')
+
+
+def compile_record(names, types):
+    """Generate a slotted class holding the fields of a recipe.
+
+    The class converts a data package from and to the flat tuple of values of
+    the struct of the recipe with code written for its fields, so no field is
+    looked up by name nor dispatched on its type when a package is packed or
+    unpacked. An attribute not set before packing raises a ValueError, like
+    with DataObject. assign sets all the fields at once from a sequence in the
+    order of the recipe.
+    """
+    if len(names) != len(types):
+        raise ValueError('List sizes are not identical.')
+    init, unpack, checks, values, fields = [], [], [], [], []
+    offset = 1 # the recipe id comes first
+    for name, data_type in zip(names, types):
+        if not name.isidentifier() or keyword.iskeyword(name) or name in RESERVED_NAMES:
+            raise ValueError('Invalid field name: ' + name)
+        size = get_item_size(data_type)
+        init.append('        self.%s = None' % name)
+        if data_type.startswith('VECTOR'):
+            unpack.append('        obj.%s = list(data[%d:%d])' % (name, offset, offset + size))
+            values.append('*self.%s' % name)
+        else:
+            unpack.append('        obj.%s = data[%d]' % (name, offset))
+            values.append('self.%s' % name)
+        checks.append('self.%s is None' % name)
+        fields.append('self.%s' % name)
+        offset += size
+    source = RECORD_TEMPLATE.format(
+        slots=tuple(['recipe_id'] + list(names)),
+        init='\n'.join(init),
+        unpack='\n'.join(unpack),
+        checks=' or '.join(checks) or 'False',
+        values=', '.join(values),
+        fields=''.join(field + ', ' for field in fields) or '()')
+    namespace = {'_new': object.__new__, '_uninitialized': _uninitialized}
+    exec(source, namespace)
+    return namespace['DataRecord']
+
+
 class DataObject(object):
     recipe_id = None
     def pack(self, names, types):
@@ -159,7 +233,7 @@ class DataObject(object):
 
 
 class DataConfig(object):
-    __slots__ = ['id', 'names', 'types', 'fmt']
+    __slots__ = ['id', '_names', 'types', 'fmt', 'codec', 'record']
     @staticmethod
     def unpack_recipe(buf):
         rmd = DataConfig()
@@ -191,13 +265,32 @@ class DataConfig(object):
                 raise ValueError('An input parameter is already in use.')
             else:
                 raise ValueError('Unknown data type: ' + i)
+        rmd.codec = struct.Struct(rmd.fmt)
+        rmd._names = None
+        rmd.record = None
         return rmd
-        
+
+    @property
+    def names(self):
+        return self._names
+
+    @names.setter
+    def names(self, names):
+        # The record class is generated once per recipe, when its names are known
+        self.record = compile_record(names, self.types)
+        self._names = names
+
     def pack(self, state):
-        l = state.pack(self.names, self.types)
-        return struct.pack(self.fmt, *l)
+        if isinstance(state, DataObject):
+            return self.codec.pack(*state.pack(self.names, self.types))
+        return self.codec.pack(*state.values())
+
+    def pack_into(self, buffer, offset, state):
+        if isinstance(state, DataObject):
+            self.codec.pack_into(buffer, offset, *state.pack(self.names, self.types))
+        else:
+            self.codec.pack_into(buffer, offset, *state.values())
 
     def unpack(self, data):
-        li =  struct.unpack_from(self.fmt, data)
-        return DataObject.unpack(li, self.names, self.types)
+        return self.record.unpack(self.codec.unpack_from(data))
     
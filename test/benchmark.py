@@ -0,0 +1,255 @@
+"""
+Benchmark of the image to trajectory pipelines.
+
+Runs every method over the images of a directory at several resolutions and
+simplifications, records the time of each stage, the peak memory, the number of
+strokes and points and the pen-up travel, writes them to a JSON file and compares
+them with a stored baseline. The exit code is 1 when a run fails, changes its number
+of strokes or points, takes more memory than the baseline allows or gets more than
+twice as slow, or when there is no baseline to compare with. Smaller slowdowns are
+only reported: the runs last a few milliseconds and their timings are noisy.
+
+    python test/benchmark.py                     # run and compare with the baseline
+    python test/benchmark.py --update-baseline   # run and store the results as baseline
+"""
+
+import argparse
+import json
+import platform
+import sys
+import tracemalloc
+from glob import glob
+from os import path
+from time import perf_counter
+
+sys.path.append(".")
+from cv2 import INTER_AREA, imread, resize
+from dotenv import load_dotenv
+from numpy import diff, hypot, ndarray
+from PIL import Image
+
+load_dotenv("config/.env")
+
+import image_processing.linedraw as linedraw
+import image_processing.trajectory_maker as tm
+from image_processing.A4_calibration import fit_to_a4_array, merge_pen_lifts
+from image_processing.timing import StageTimer
+
+METHODS = ["canny", "bluredcanny", "sobel", "laplacian", "linedraw"]
+RESOLUTIONS = [640, 1280]
+EPSILONS = [1, 2, 4]
+BASELINE = "test/benchmark_baseline.json"
+
+
+def pen_up_travel(points: ndarray) -> float:
+    """
+    Return the distance travelled with the pen up, in mm.
+
+    A move is pen-up when both of its waypoints are above the drawing height.
+    """
+    up = points[:, 2] > points[:, 2].min()
+    moves = up[1:] & up[:-1]
+    steps = diff(points[:, :2], axis=0)[moves]
+    return float(hypot(steps[:, 0], steps[:, 1]).sum()) * 1000
+
+
+def scaled(image, resolution: int):
+    """Resize an image so its longest side is resolution pixels."""
+    height, width = image.shape[:2]
+    ratio = resolution / max(height, width)
+    size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    return resize(image, size, interpolation=INTER_AREA)
+
+
+def run_once(image, method: str, epsilon: float, resolution: int) -> dict:
+    """Run one pipeline and return its stats."""
+    stats = {}
+    if method == "linedraw":
+        photo = Image.fromarray(image[:, :, ::-1])
+        lines = linedraw.sketch(photo, resolution=resolution, seed=0, stats=stats)
+        timer = StageTimer(stats)
+        points, stroke_index = fit_to_a4_array(lines)
+        points, _, stats["lifts_removed"] = merge_pen_lifts(points, stroke_index)
+        timer.lap("fit")
+        strokes = len(lines)
+    else:
+        points, _, strokes, _ = tm.trajectory_computation(
+            image, epsilon, method, order="nearest", stats=stats, report_travel=True
+        )
+    stats["strokes"] = strokes
+    stats["points"] = len(points)
+    stats["pen_up_travel_mm"] = round(pen_up_travel(points), 1)
+    return stats
+
+
+def measure(image, method: str, epsilon: float, resolution: int, repeat: int) -> dict:
+    """Run a pipeline several times and keep the median timings and the peak memory."""
+    runs = []
+    for _ in range(repeat):
+        start = perf_counter()
+        stats = run_once(image, method, epsilon, resolution)
+        stats["total"] = perf_counter() - start
+        runs.append(stats)
+    runs.sort(key=lambda stats: stats["total"])
+    best = runs[len(runs) // 2]
+
+    # Memory is measured on a separate run, tracemalloc slows everything down
+    tracemalloc.start()
+    run_once(image, method, epsilon, resolution)
+    best["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+    tracemalloc.stop()
+
+    best["total"] = round(best["total"], 4)
+    best["timings"] = {k: round(v, 4) for k, v in best["timings"].items()}
+    return best
+
+
+def run(args) -> list:
+    """Run the whole benchmark and return the list of results."""
+    files = sorted(
+        f
+        for pattern in ("*.png", "*.jpg", "*.jpeg")
+        for f in glob(path.join(args.images, pattern))
+    )
+    results = []
+    for file in files:
+        original = imread(file)
+        for resolution in args.resolutions:
+            image = scaled(original, resolution)
+            for method in args.methods:
+                # linedraw has no epsilon, it only depends on the resolution
+                epsilons = [None] if method == "linedraw" else args.epsilons
+                for epsilon in epsilons:
+                    entry = {
+                        "image": path.basename(file),
+                        "method": method,
+                        "resolution": resolution,
+                        "epsilon": epsilon,
+                    }
+                    try:
+                        entry.update(
+                            measure(image, method, epsilon, resolution, args.repeat)
+                        )
+                    except Exception as e:
+                        entry["error"] = repr(e)
+                    results.append(entry)
+                    print(summary(entry))
+    return results
+
+
+def summary(entry: dict) -> str:
+    """Format one result on a line."""
+    name = f"{entry['image']:<14}{entry['method']:<12}{entry['resolution']:>5}px eps={entry['epsilon']}"
+    if "error" in entry:
+        return f"{name}  ERROR {entry['error']}"
+    return (
+        f"{name}  {entry['total'] * 1000:8.1f} ms  {entry['peak_memory_mb']:7.2f} MB"
+        f"  {entry['strokes']:5} strokes  {entry['points']:6} points"
+        f"  {entry['pen_up_travel_mm']:9.1f} mm pen-up"
+    )
+
+
+def key(entry: dict) -> tuple:
+    return entry["image"], entry["method"], entry["resolution"], entry["epsilon"]
+
+
+def compare(
+    results: list, baseline: list, tolerance: float, slack: float, slowdown: float
+) -> list:
+    """
+    Compare results with a baseline.
+
+    A run regresses when it fails while it used to work, when its number of strokes or
+    points changes, when its peak memory grows by more than the tolerance, or when its
+    total time grows more than slowdown times (plus slack seconds, for very short
+    runs). A total time growing by more than the tolerance only prints a warning.
+    """
+    previous = {key(entry): entry for entry in baseline}
+    regressions = []
+    for entry in results:
+        old = previous.get(key(entry))
+        if old is None or "error" in old:
+            continue
+        name = " ".join(str(k) for k in key(entry))
+        if "error" in entry:
+            regressions.append(f"{name}: fails with {entry['error']}")
+            continue
+        times = (
+            f"{name}: {old['total'] * 1000:.1f} ms -> {entry['total'] * 1000:.1f} ms"
+        )
+        if entry["total"] > old["total"] * slowdown + slack:
+            regressions.append(times)
+        elif entry["total"] > old["total"] * (1 + tolerance) + slack:
+            print(f"warning: {times}")
+        if entry["peak_memory_mb"] > old["peak_memory_mb"] * (1 + tolerance) + 1:
+            regressions.append(
+                f"{name}: {old['peak_memory_mb']} MB -> {entry['peak_memory_mb']} MB"
+            )
+        for field in ("strokes", "points"):
+            if entry[field] != old[field]:
+                regressions.append(f"{name}: {field} {old[field]} -> {entry[field]}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--images", default="image", help="directory of the images")
+    parser.add_argument("--methods", nargs="+", default=METHODS, choices=METHODS)
+    parser.add_argument("--resolutions", nargs="+", type=int, default=RESOLUTIONS)
+    parser.add_argument("--epsilons", nargs="+", type=float, default=EPSILONS)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per setting")
+    parser.add_argument("--output", default="benchmark.json", help="results file")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed relative growth of the memory, and of the time before a warning",
+    )
+    parser.add_argument(
+        "--slowdown", type=float, default=2.0, help="time factor failing the run"
+    )
+    parser.add_argument(
+        "--slack", type=float, default=0.005, help="allowed absolute slowdown (s)"
+    )
+    args = parser.parse_args()
+
+    results = run(args)
+    report = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not path.exists(args.baseline):
+        # Without a baseline no regression can be found, don't pass silently
+        print(
+            f"no baseline at {args.baseline}, run with --update-baseline to create it"
+        )
+        return 1
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(results, baseline, args.tolerance, args.slack, args.slowdown)
+    if regressions:
+        print(f"\n{len(regressions)} REGRESSION(S) against {args.baseline}:")
+        for regression in regressions:
+            print("  " + regression)
+        print("run with --update-baseline if the changes are expected")
+        return 1
+    print(f"\nno regression against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
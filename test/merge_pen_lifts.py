@@ -0,0 +1,64 @@
+"""
+Check of merge_pen_lifts on hand-made waypoints.
+
+Five strokes along X: the gaps between the first three are below the tolerance so they
+become one pen-down path, the next gap is large and the last one is just above it.
+
+    python test/merge_pen_lifts.py
+"""
+
+import sys
+
+sys.path.append(".")
+from numpy import array, array_equal, int64
+
+from image_processing.A4_calibration import merge_pen_lifts
+
+LOW, HIGH = 0.07, 0.085
+
+
+def waypoints_of(strokes: list) -> tuple:
+    """Build the waypoints and stroke index like fit_to_a4_array, in m."""
+    rows, index = [(0, 0, HIGH)], [-1]
+    for i, stroke in enumerate(strokes):
+        rows.append((*stroke[0], HIGH))
+        rows += [(x, y, LOW) for x, y in stroke]
+        rows.append((*stroke[-1], HIGH))
+        index += [i] * (len(stroke) + 2)
+    rows.append((0, 0, HIGH))
+    index.append(-1)
+    waypoints = array([(x, y, z, 0, 0, 0) for x, y, z in rows], float)
+    return waypoints, array(index, int64)
+
+
+strokes = [
+    [(0.0, 0.0), (0.01, 0.0)],
+    [(0.0102, 0.0), (0.02, 0.0)],  # 0.2 mm after the first one
+    [(0.0203, 0.0), (0.025, 0.0), (0.029, 0.0)],  # 0.3 mm after the second one
+    [(0.04, 0.0), (0.05, 0.0)],  # 11 mm gap
+    [(0.0506, 0.0), (0.06, 0.0)],  # 0.6 mm gap, just above the tolerance
+]
+waypoints, stroke_index = waypoints_of(strokes)
+assert len(waypoints) == 23
+
+# The chain of the three first strokes loses the lift rows 4, 5 and 8, 9
+merged, merged_index, removed = merge_pen_lifts(waypoints, stroke_index, 0.5)
+assert removed == 2
+kept = [i for i in range(len(waypoints)) if i not in (4, 5, 8, 9)]
+assert array_equal(merged, waypoints[kept])
+assert merged_index.tolist() == [-1] + [0] * 9 + [1] * 4 + [2] * 4 + [-1]
+# The pen stays down from the first point to the end of the third stroke
+assert (merged[2:9, 2] == LOW).all()
+
+# A wider tolerance also merges the last gap
+merged, merged_index, removed = merge_pen_lifts(waypoints, stroke_index, 1)
+assert removed == 3
+assert len(merged) == len(waypoints) - 6
+assert merged_index.tolist() == [-1] + [0] * 9 + [1] * 6 + [-1]
+
+# Nothing below the tolerance, nothing changes
+merged, merged_index, removed = merge_pen_lifts(waypoints, stroke_index, 0.1)
+assert removed == 0
+assert array_equal(merged, waypoints) and array_equal(merged_index, stroke_index)
+
+print("merge_pen_lifts: ok")
@@ -0,0 +1,185 @@
+"""
+Benchmark of the RTDE client against a fake controller on the loopback.
+
+The fake controller answers the handshake, then streams data packages as fast as the
+socket takes them and closes the connection. The client reads every one of them with
+receive_buffered, 64 KiB ahead at most, or only the latest with receive, and the
+benchmark prints the packages per second and the peak memory traced while reading
+them. In the send modes, the client sends a setpoint and a watchdog kick per cycle
+instead, with two send calls or a single send_many.
+
+    python test/rtde_benchmark.py
+    python test/rtde_benchmark.py --mode latest --packets 200000
+    python test/rtde_benchmark.py --mode send_many
+"""
+
+import argparse
+import socket
+import struct
+import sys
+import tracemalloc
+from threading import Thread
+from time import perf_counter
+
+sys.path.append(".")
+import rtde.rtde as rtde
+
+# A state recipe like the one of the drawing loop
+NAMES = [
+    "timestamp",
+    "actual_TCP_pose",
+    "target_q",
+    "runtime_state",
+    "output_int_register_0",
+]
+TYPES = ["DOUBLE", "VECTOR6D", "VECTOR6D", "UINT32", "INT32"]
+FORMAT = ">BdddddddddddddIi"
+RECIPE_ID = 1
+SETP_NAMES = [f"input_double_register_{i}" for i in range(6)]
+WATCHDOG_NAMES = ["input_int_register_0"]
+MODES = ["buffered", "latest", "send", "send_many"]
+# Bytes receive_buffered reads ahead, about 500 packages
+BUFFER_LIMIT = 65536
+
+
+def package(command: int, payload: bytes = b"") -> bytes:
+    """Return an RTDE package with its header."""
+    return struct.pack(">HB", len(payload) + 3, command) + payload
+
+
+def fake_controller(server: socket.socket, packets: int, drain: bool = False) -> None:
+    """
+    Answer the handshake of one client, then send it the data packages, or read
+    what it sends until it disconnects if drain is True.
+    """
+    conn, _ = server.accept()
+    input_id = RECIPE_ID
+    data = b"".join(
+        package(
+            rtde.Command.RTDE_DATA_PACKAGE,
+            struct.pack(FORMAT, RECIPE_ID, i * 0.002, *range(12), 2, i),
+        )
+        for i in range(packets)
+    )
+    with conn:
+        while True:
+            header = conn.recv(3, socket.MSG_WAITALL)
+            if len(header) < 3:
+                return
+            size, command = struct.unpack(">HB", header)
+            payload = conn.recv(size - 3, socket.MSG_WAITALL) if size > 3 else b""
+            if command == rtde.Command.RTDE_CONTROL_PACKAGE_SETUP_OUTPUTS:
+                recipe = bytes([RECIPE_ID]) + ",".join(TYPES).encode()
+                conn.sendall(package(command, recipe))
+            elif command == rtde.Command.RTDE_CONTROL_PACKAGE_SETUP_INPUTS:
+                input_id += 1
+                types = [
+                    "DOUBLE" if "double" in name else "INT32"
+                    for name in payload.decode().split(",")
+                ]
+                recipe = bytes([input_id]) + ",".join(types).encode()
+                conn.sendall(package(command, recipe))
+            else:
+                conn.sendall(package(command, b"\x01"))
+            if command == rtde.Command.RTDE_CONTROL_PACKAGE_START:
+                break
+        if drain:
+            buf = bytearray(65536)
+            while conn.recv_into(buf):
+                pass
+        else:
+            conn.sendall(data)
+
+
+def run(mode: str, packets: int, trace: bool) -> tuple:
+    """
+    Read all the packages of a fake controller, or send it as many cycles.
+
+    Returns:
+        tuple: The duration in seconds, the number of packages returned and the
+        number of packages skipped.
+    """
+    sending = mode.startswith("send")
+    server = socket.create_server(("127.0.0.1", 0))
+    thread = Thread(
+        target=fake_controller, args=(server, packets, sending), daemon=True
+    )
+    thread.start()
+    con = rtde.RTDE("127.0.0.1", server.getsockname()[1])
+    con.connect()
+    con.send_output_setup(NAMES, TYPES)
+    if sending:
+        setp = con.send_input_setup(SETP_NAMES, ["DOUBLE"] * 6)
+        watchdog = con.send_input_setup(WATCHDOG_NAMES, ["INT32"])
+        watchdog.input_int_register_0 = 0
+    con.send_start()
+
+    if trace:
+        tracemalloc.start()
+    received = 0
+    start = perf_counter()
+    if sending:
+        pose = [0.25, 0.1, 0.04, 0.0, 0.0, 0.0]
+        for i in range(packets):
+            pose[0] = 0.25 + i * 1e-6
+            # Like the connector, which works on both DataObject and records
+            for name, value in zip(SETP_NAMES, pose):
+                setattr(setp, name, value)
+            if mode == "send":
+                con.send(setp)
+                con.send(watchdog)
+            else:
+                con.send_many((setp, watchdog))
+        duration = perf_counter() - start
+        con.disconnect()
+        thread.join()
+        server.close()
+        return duration, 0, 0
+    try:
+        while True:
+            if mode == "buffered":
+                state = con.receive_buffered(buffer_limit=BUFFER_LIMIT)
+            else:
+                state = con.receive()
+            if state is not None:
+                received += 1
+            elif not con.is_connected():
+                # receive_buffered returns None once disconnected and emptied
+                break
+    except rtde.RTDEException:
+        # The fake controller closes the connection after the last package
+        pass
+    duration = perf_counter() - start
+    con.disconnect()
+    thread.join()
+    server.close()
+    return duration, received, con.skipped_package_count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=MODES, default="buffered")
+    parser.add_argument("--packets", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    best = min(run(args.mode, args.packets, False) for _ in range(args.repeat))
+    duration, received, skipped = best
+    run(args.mode, args.packets, True)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"mode:           {args.mode}")
+    if args.mode.startswith("send"):
+        print(f"cycles:         {args.packets} setpoints and watchdog kicks sent")
+        print(f"cycles/s:       {args.packets / duration:,.0f}")
+    else:
+        print(
+            f"packages:       {args.packets} sent, {received} returned, {skipped} skipped"
+        )
+        print(f"packages/s:     {args.packets / duration:,.0f}")
+    print(f"peak memory:    {peak / 1024:,.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Check that the grid-indexed greedy ordering gives the same sequence as the naive scan.
+
+Without loop rotation, order_strokes must pick the same next stroke and the same
+direction as linedraw.sortlines(method="naive"): the nearest endpoint, the lowest
+stroke and its first point on a tie. Random strokes are compared, with integer
+coordinates full of ties and duplicates, and with clusters far apart so the ring
+search and the rebuilds of the grid are exercised.
+
+    python test/stroke_order.py
+"""
+
+import sys
+from random import Random
+
+sys.path.append(".")
+from image_processing.linedraw import sortlines
+from image_processing.stroke_order import order_strokes
+from image_processing.strokes import Strokes
+
+
+def random_strokes(rng: Random, count: int, place) -> list:
+    """Build count strokes of 2 to 5 points, some of them closed, placed by place."""
+    strokes = []
+    for _ in range(count):
+        stroke = [place() for _ in range(rng.randint(2, 5))]
+        if rng.random() < 0.2:
+            stroke.append(stroke[0])
+        strokes.append(stroke)
+    return strokes
+
+
+def as_tuples(lines) -> list:
+    return [[(float(x), float(y)) for x, y in line] for line in lines]
+
+
+def check(lines: list) -> None:
+    expected = as_tuples(sortlines(lines, method="naive"))
+    assert as_tuples(order_strokes(lines, rotate_loops=False)) == expected
+    # Strokes holds float32 coordinates, compared with the naive scan on the same ones
+    strokes = Strokes.from_lists(lines)
+    expected = as_tuples(sortlines(strokes.to_lists(), method="naive"))
+    assert as_tuples(order_strokes(strokes, rotate_loops=False).to_lists()) == expected
+
+
+rng = Random(0)
+cases = 0
+for count in (1, 2, 3, 10, 50, 300):
+    for _ in range(5):
+        # Uniform coordinates
+        check(
+            random_strokes(
+                rng, count, lambda: (rng.uniform(0, 100), rng.uniform(0, 100))
+            )
+        )
+        # A small integer grid: equal distances and repeated points everywhere
+        check(
+            random_strokes(rng, count, lambda: (rng.randint(0, 4), rng.randint(0, 4)))
+        )
+        # Tight clusters far from each other, and a few strays between them
+        centers = [(rng.uniform(-400, 400), rng.uniform(-400, 400)) for _ in range(4)]
+
+        def clustered():
+            if rng.random() < 0.05:
+                return rng.uniform(-400, 400), rng.uniform(-400, 400)
+            cx, cy = rng.choice(centers)
+            return cx + rng.randint(-2, 2), cy + rng.randint(-2, 2)
+
+        check(random_strokes(rng, count, clustered))
+        cases += 3
+
+print(f"stroke_order: ok ({cases} cases)")
@@ -0,0 +1,176 @@
+"""
+Compute the trajectories of a batch of images without the GUI.
+
+Every image is processed in a pool of processes and gives a JSON file holding the
+waypoints sent to the robot and the stats of the drawing: points, strokes and
+estimated drawing time.
+
+    python tools/batch.py image/ --method bluredcanny --epsilon 2 --output queue/
+    python tools/batch.py "photos/*.jpg" --method linedraw --max-duration 600
+"""
+
+import argparse
+import json
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from glob import glob
+from os import makedirs, path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+sys.path.append(ROOT)
+from cv2 import imread
+from dotenv import load_dotenv
+from PIL import Image
+
+load_dotenv(path.join(ROOT, "config", ".env"))
+
+import image_processing.linedraw as linedraw
+from image_processing.A4_calibration import fit_to_a4_array, merge_pen_lifts
+from image_processing.pipeline import warp
+from image_processing.simplify import estimate_duration, waypoints_for_duration
+from image_processing.trajectory_maker import trajectory_computation
+
+METHODS = ["canny", "bluredcanny", "sobel", "laplacian", "linedraw"]
+EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+def find_images(inputs: list) -> list:
+    """Expand directories and glob patterns into a sorted list of image files."""
+    files = set()
+    for item in inputs:
+        if path.isdir(item):
+            candidates = glob(path.join(item, "*"))
+        else:
+            candidates = glob(item)
+        files.update(f for f in candidates if f.lower().endswith(EXTENSIONS))
+    return sorted(files)
+
+
+def output_name(file: str) -> str:
+    """Return the name of the JSON file of an image, its extension kept so a.png and
+    a.jpg don't collide."""
+    return path.basename(file) + ".json"
+
+
+def process(file: str, options: dict) -> dict:
+    """
+    Compute the trajectory of one image and write it next to the others.
+
+    Args:
+        file (str): The path of the image.
+        options (dict): The parsed command line options.
+
+    Returns:
+        dict: The stats of the drawing.
+    """
+    image = imread(file)
+    if image is None:
+        raise ValueError(f"can't read {file}")
+    # No window to click the corners in, an undetected sheet fails the image
+    image, _ = warp(image, options["crop"], interactive=False)
+
+    stats = {}
+    if options["method"] == "linedraw":
+        # imread gives BGR and PIL expects RGB
+        photo = Image.fromarray(image[:, :, ::-1])
+        lines = linedraw.sketch(
+            photo,
+            resolution=options["resolution"],
+            seed=options["seed"],
+            stats=stats,
+            max_points=options["max_points"],
+        )
+        waypoints, stroke_index = fit_to_a4_array(lines)
+        waypoints, _, stats["lifts_removed"] = merge_pen_lifts(
+            waypoints, stroke_index, options["lift_tolerance"]
+        )
+        strokes = len(lines)
+    else:
+        waypoints, _, strokes, _ = trajectory_computation(
+            image,
+            options["epsilon"],
+            options["method"],
+            order=options["order"],
+            stats=stats,
+            max_points=options["max_points"],
+            lift_tolerance_mm=options["lift_tolerance"],
+        )
+
+    stats.update(
+        {
+            "image": file,
+            "strokes": strokes,
+            "points": len(waypoints),
+            "estimated_seconds": round(estimate_duration(len(waypoints)), 1),
+        }
+    )
+    with open(path.join(options["output"], output_name(file)), "w") as f:
+        json.dump(
+            {"options": options, "stats": stats, "waypoints": waypoints.tolist()}, f
+        )
+    return stats
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("inputs", nargs="+", help="image files, directories or globs")
+    parser.add_argument("--method", default="bluredcanny", choices=METHODS)
+    parser.add_argument("--epsilon", type=float, default=2, help="contour precision")
+    parser.add_argument("--order", default="nearest", choices=["area", "nearest"])
+    parser.add_argument("--resolution", type=int, default=2048, help="linedraw only")
+    parser.add_argument("--seed", type=int, default=0, help="linedraw noise seed")
+    parser.add_argument("--crop", action="store_true", help="straighten the sheet")
+    parser.add_argument("--max-points", type=int, help="maximum number of waypoints")
+    parser.add_argument(
+        "--max-duration", type=float, help="maximum drawing time in seconds"
+    )
+    parser.add_argument(
+        "--lift-tolerance", type=float, default=0.5, help="gap drawn without lift (mm)"
+    )
+    parser.add_argument("--output", default="trajectories", help="output directory")
+    parser.add_argument(
+        "--workers", type=int, help="processes, all the cores by default"
+    )
+    args = parser.parse_args()
+
+    options = vars(args).copy()
+    del options["inputs"], options["workers"], options["max_duration"]
+    if args.max_duration is not None:
+        budget = waypoints_for_duration(args.max_duration)
+        options["max_points"] = min(budget, args.max_points or budget)
+
+    files = find_images(args.inputs)
+    if not files:
+        print("no image found")
+        return 1
+    # Images of the same name in different directories would overwrite each other
+    counts = Counter(output_name(file) for file in files)
+    duplicates = sorted(f for f in files if counts[output_name(f)] > 1)
+    if duplicates:
+        print("several images would write the same file, rename or run them apart:")
+        for file in duplicates:
+            print(f"  {file} -> {output_name(file)}")
+        return 1
+    makedirs(args.output, exist_ok=True)
+
+    failures = 0
+    with ProcessPoolExecutor(args.workers) as pool:
+        jobs = {pool.submit(process, file, options): file for file in files}
+        for job in as_completed(jobs):
+            try:
+                stats = job.result()
+            except Exception as e:
+                failures += 1
+                print(f"{jobs[job]}: ERROR {e!r}")
+                continue
+            print(
+                f"{stats['image']}: {stats['strokes']} strokes, {stats['points']} points,"
+                f" about {stats['estimated_seconds'] / 60:.1f} min"
+            )
+    print(f"{len(files) - failures}/{len(files)} trajectories written to {args.output}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())